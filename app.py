@@ -1,33 +1,69 @@
+import base64
+import datetime
+import json
 import os
-import openpyxl
-import msal
 import requests
-from flask import Flask, redirect, render_template, request, session, url_for
-from io import BytesIO  # Required to read Excel file from memory
+import graph_client
+import graph_workbook
+import http_cache
+import lesson_index
+import lesson_log
+import offload
+import onedrive_cache
+import prefetch
+import timing
+import token_cache
+import workbook_cache
+from flask import Flask, jsonify, redirect, request, session, stream_template, url_for
 
-from config import CLIENT_ID, CLIENT_SECRET, AUTHORITY, REDIRECT_URI, SCOPE
+from config import (
+    AUTHORITY,
+    CACHE_DIR,
+    LESSON_CACHE_BYTES,
+    LESSON_CACHE_DISK_BYTES,
+    LESSON_CACHE_TTL,
+    LESSON_FETCH_MODE,
+    LESSON_LOG_TABLE,
+    LESSONS_PAGE_MAX,
+    LESSONS_PAGE_SIZE,
+    PREFETCH_ACTIVE_WINDOW,
+    PREFETCH_INTERVAL,
+    PREFETCH_WORKERS,
+    REDIRECT_URI,
+    SCOPE,
+)
 
 app = Flask(__name__)
-app.secret_key = os.urandom(24)
+# A fixed key lets sessions survive restarts and work across gunicorn workers
+app.secret_key = os.environ.get("FLASK_SECRET_KEY") or os.urandom(24)
+timing.init_app(app)
+http_cache.init_app(app)
 
-
-def _build_msal_app(cache=None, authority=None):
-    """Builds and returns the MSAL ConfidentialClientApplication."""
-    return msal.ConfidentialClientApplication(
-        CLIENT_ID,
-        authority=authority or AUTHORITY,
-        client_credential=CLIENT_SECRET,
-        token_cache=cache,
-    )
+# Per-user LessonIndex for /lessons and /api/lessons, keyed by the workbook
+# version it reflects and kept within a memory budget however many users sign in
+lesson_indexes = workbook_cache.WorkbookCache(
+    "lesson_index",
+    budget_bytes=LESSON_CACHE_BYTES,
+    ttl=LESSON_CACHE_TTL,
+    spill_dir=os.path.join(CACHE_DIR, "lesson-indexes"),
+    spill_budget_bytes=LESSON_CACHE_DISK_BYTES,
+)
+timing.add_collector(workbook_cache.metric_lines)
 
 
 def _build_auth_code_flow(scopes=None, redirect_uri=None):
     """Initiates the auth code flow for the given scopes and redirect URI."""
-    return _build_msal_app().initiate_auth_code_flow(
+    return token_cache.initiate_auth_code_flow(
         scopes or [], redirect_uri=redirect_uri or REDIRECT_URI
     )
 
 
+def _get_access_token():
+    """Returns a Graph access token for the signed-in user, refreshing it silently if needed."""
+    with timing.span("token"):
+        return token_cache.acquire_token_silent(session.get("account_id"), SCOPE)
+
+
 @app.route("/")
 def index():
     """Main route: checks if user is authenticated."""
@@ -46,10 +82,8 @@ def login():
 @app.route("/callback")
 def authorized():
     """Handles the callback after successful authentication."""
-    cache = msal.SerializableTokenCache()
-
     try:
-        result = _build_msal_app(cache=cache).acquire_token_by_auth_code_flow(
+        result, account_id = token_cache.acquire_token_by_auth_code_flow(
             session.get("flow", {}), request.args
         )
     except ValueError:
@@ -58,47 +92,427 @@ def authorized():
     if "error" in result:
         return f"Error: {result['error']} - {result.get('error_description')}", 400
 
-    # Save user and access token in session
+    # Tokens stay in the persistent cache; the session only remembers whose they are
+    session.pop("flow", None)
     session["user"] = result.get("id_token_claims")
-    session["access_token"] = result.get("access_token")
+    session["account_id"] = account_id
+
+    # Warm the user's cache while the browser follows the redirect
+    user_id = _current_user_id()
+    if user_id and account_id:
+        prefetcher.submit(user_id, account_id)
     return redirect(url_for("lessons"))
 
 
+def _current_user_id():
+    """Returns a stable id for the signed-in user, used to key per-user caches."""
+    claims = session.get("user") or {}
+    return claims.get("oid") or claims.get("sub")
+
+
+def _response_etag(response):
+    """Returns the ETag (or cTag) of a content download, looking through redirects."""
+    for resp in [response] + list(response.history):
+        etag = resp.headers.get("ETag") or resp.headers.get("cTag")
+        if etag:
+            return etag
+    return None
+
+
+def _render_lessons(headers, rows, filters=None, next_cursor=None):
+    """Streams the lessons page with its first page of rows; the browser fetches the rest."""
+    stream = stream_template(
+        "lessons.html", headers=headers, lessons=rows, filters=filters or {}, next_cursor=next_cursor
+    )
+    return app.response_class(timing.TimedIterator("render", stream))
+
+
+def _lessons_via_workbook_api(user_id, token, indexed=None):
+    """Returns (etag, headers, rows) read as cell values through the Graph workbook API."""
+    cached_etag = onedrive_cache.get_etag(user_id)
+    if cached_etag:
+        # Checking the tag alone is the cheapest call when the cache is likely still good
+        with timing.span("graph_metadata"):
+            etag = graph_workbook.get_item_tag(token)
+        if etag == cached_etag:
+            if indexed is not None and indexed(etag):
+                return etag, None, None
+            cached = onedrive_cache.open_rows(user_id)
+            if cached is not None:
+                cached_headers, cached_rows = cached
+                return etag, cached_headers, offload.iterate(cached_rows)
+
+    # Tag, used range and first page in one round trip; later pages follow as rows are read
+    with timing.span("graph_range"):
+        etag, (sheet_headers, rows), _ = graph_workbook.fetch_tracker(
+            user_id, token, reference_lists=False
+        )
+    if etag:
+        rows = onedrive_cache.cache_rows(user_id, etag, sheet_headers, rows)
+    return etag, sheet_headers, rows
+
+
+class LessonFetchError(Exception):
+    """Raised when the lesson log can't be fetched; carries the HTTP status to return."""
+
+    def __init__(self, message, status):
+        super().__init__(message)
+        self.status = status
+
+
+def _lessons_via_download(user_id, token, indexed=None):
+    """Returns (etag, headers, rows) from the downloaded (or revalidated) workbook."""
+    file_path = "/me/drive/root:/LessonTracker.xlsx:/content"
+
+    # Revalidate the cached copy instead of downloading the whole workbook again
+    try:
+        cached_etag = onedrive_cache.get_etag(user_id)
+        if cached_etag:
+            with timing.span("graph_revalidate"):
+                response = graph_client.get(
+                    file_path, token, name="workbook_content",
+                    headers={"If-None-Match": cached_etag}, stream=True,
+                )
+            if response.status_code == 304:
+                response.close()
+                if indexed is not None and indexed(cached_etag):
+                    return cached_etag, None, None
+                cached = onedrive_cache.open_rows(user_id)
+                if cached is not None:
+                    cached_headers, cached_rows = cached
+                    return cached_etag, cached_headers, offload.iterate(cached_rows)
+                # Tag survived but the rows did not, so fall through to a full download
+                with timing.span("graph_headers"):
+                    response = graph_client.get(file_path, token, name="workbook_content", stream=True)
+        else:
+            # Only the response headers arrive here; the body is timed as graph_download
+            with timing.span("graph_headers"):
+                response = graph_client.get(file_path, token, name="workbook_content", stream=True)
+    except requests.RequestException as e:
+        raise LessonFetchError(f"Failed to download Excel file: {e}", 504)
+
+    if response.status_code != 200:
+        raise LessonFetchError(f"Failed to download Excel file: {response.text}", 400)
+
+    # Spool the download to disk and read 'lesson log' from it row by row
+    try:
+        with response, timing.span("graph_download"):
+            content_path = onedrive_cache.store_content(
+                user_id, response.iter_content(chunk_size=64 * 1024)
+            )
+        # Parsing is CPU-bound, so under gevent it runs on native threads
+        with timing.span("workbook_open"):
+            sheet_headers, rows = offload.call(lesson_log.iter_lesson_rows, content_path)
+        rows = offload.iterate(rows)
+    except Exception as e:
+        raise LessonFetchError(f"Error reading Excel file: {e}", 500)
+
+    etag = _response_etag(response)
+    if etag:
+        rows = onedrive_cache.cache_rows(user_id, etag, sheet_headers, rows)
+    return etag, sheet_headers, rows
+
+
+def _fetch_lessons(user_id, token, indexed=None):
+    """Returns (etag, headers, rows) of 'lesson log' using the configured fetch mode.
+
+    rows is a lazy iterator; etag identifies the workbook version it came from.
+    When the cached copy is still current and indexed(etag) is true, nothing
+    is opened and (etag, None, None) is returned.
+    """
+    if LESSON_FETCH_MODE == "workbook":
+        try:
+            return _lessons_via_workbook_api(user_id, token, indexed)
+        except (graph_workbook.WorkbookError, requests.RequestException) as e:
+            print(f"Workbook API read failed, falling back to download: {e}")
+
+    return _lessons_via_download(user_id, token, indexed)
+
+
+def _get_lesson_index(user_id, token):
+    """Returns (etag, LessonIndex) for the user, updating the index only if the workbook changed."""
+    cached = None
+
+    # Looked up once the tag is confirmed but before any rows are opened, so
+    # a revalidated page view never touches the row cache or the workbook
+    def indexed(etag):
+        nonlocal cached
+        cached = lesson_indexes.get(user_id, graph_workbook.ITEM_PATH, etag)
+        return cached is not None
+
+    etag, sheet_headers, rows = _fetch_lessons(user_id, token, indexed)
+    if rows is None:
+        return etag, cached
+
+    with timing.span("parse"):
+        rows = list(rows)
+    # The generation names the workbook version in page ETags, so every worker
+    # holding it must agree; without a tag from Graph, the rows identify it
+    generation = etag or http_cache.make_etag(sheet_headers, rows)
+    # An older version is brought up to date in a copy, which only indexes
+    # appended rows; the cached one stays as it is for requests reading it
+    held = lesson_indexes.held(user_id, graph_workbook.ITEM_PATH)
+    index = held[1] if held else lesson_index.LessonIndex(sheet_headers, generation)
+    with timing.span("index_refresh"):
+        index = offload.call(index.refresh, sheet_headers, rows, generation)
+    if etag:
+        lesson_indexes.put(user_id, graph_workbook.ITEM_PATH, etag, index)
+    return etag, index
+
+
+def _prefetch_lessons(user_id, account_id):
+    """Downloads and parses the user's lesson log into the row cache and LessonIndex."""
+    token = token_cache.acquire_token_silent(account_id, SCOPE)
+    if token:
+        _get_lesson_index(user_id, token)
+
+
+prefetcher = prefetch.Prefetcher(
+    _prefetch_lessons,
+    workers=PREFETCH_WORKERS,
+    interval=PREFETCH_INTERVAL,
+    active_window=PREFETCH_ACTIVE_WINDOW,
+)
+
+
+def _parse_date_arg(name):
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        raise LessonFetchError(f"Invalid '{name}' date, expected YYYY-MM-DD: {value}", 400)
+
+
+def _parse_filters():
+    return {
+        "athlete": request.args.get("athlete") or None,
+        "lesson_type": request.args.get("type") or None,
+        "date_from": _parse_date_arg("from"),
+        "date_to": _parse_date_arg("to"),
+    }
+
+
+def _encode_cursor(index, descending, key):
+    """Returns an opaque cursor for the page after key, or None at the end."""
+    if key is None:
+        return None
+    date, position = key
+    # The rows the key was taken from are named by their count and digest, so
+    # any worker whose index still starts with them can carry on from it
+    count = len(index.rows)
+    raw = json.dumps([count, index.prefix_digest(count), descending, date.toordinal(), position])
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor, index, descending):
+    """Returns the (date, position) key a cursor continues from."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        count, digest, cursor_descending, ordinal, position = json.loads(raw)
+        count = int(count)
+        key = (datetime.date.fromordinal(ordinal), int(position))
+    except (ValueError, TypeError):
+        raise LessonFetchError("Invalid cursor", 400)
+    if cursor_descending != descending:
+        raise LessonFetchError("The cursor was issued for a different sort order", 400)
+    if digest is None or index.prefix_digest(count) != digest:
+        # Rows were edited or removed, so positions no longer line up
+        raise LessonFetchError("The lesson log has changed; start again without a cursor", 410)
+    return key
+
+
+def _json_cell(value):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    return value
+
+
+def _open_lesson_index(user_id, token):
+    """Waits for any background prefetch and returns the user's (etag, LessonIndex)."""
+    prefetcher.touch(user_id, session.get("account_id"))
+    with timing.span("prefetch_join"):
+        prefetcher.join(user_id)
+    return _get_lesson_index(user_id, token)
+
+
 @app.route("/lessons")
 def lessons():
-    """Fetches and displays lessons from the Excel file stored in OneDrive."""
-    if "access_token" not in session:
+    """Displays the newest page of lessons from the Excel file stored in OneDrive.
+
+    Optional filters: ?athlete=...&type=...&from=YYYY-MM-DD&to=YYYY-MM-DD.
+    Older lessons are loaded from /api/lessons as the user scrolls.
+    """
+    user_id = _current_user_id()
+    token = _get_access_token() if user_id else None
+    if not token:
         return redirect(url_for("login"))
 
-    token = session["access_token"]
-    headers = {"Authorization": f"Bearer {token}"}
-    file_url = "https://graph.microsoft.com/v1.0/me/drive/root:/LessonTracker.xlsx:/content"
+    try:
+        filters = _parse_filters()
+        etag, index = _open_lesson_index(user_id, token)
+        page_etag = http_cache.make_etag(user_id, etag, index.generation, request.full_path)
+        # Graph already confirmed the workbook version, so the page needn't be rendered
+        if etag and http_cache.is_fresh(page_etag):
+            return http_cache.not_modified(page_etag)
+        with timing.span("index_query"):
+            rows, last_key = index.page(LESSONS_PAGE_SIZE, **filters)
+        response = _render_lessons(
+            index.headers, rows, filters, _encode_cursor(index, True, last_key)
+        )
+    except LessonFetchError as e:
+        return str(e), e.status
+    if etag:
+        http_cache.set_etag(response, page_etag)
+    return response
+
 
-    response = requests.get(file_url, headers=headers)
+@app.route("/api/lessons")
+def api_lessons():
+    """Returns one page of lessons as JSON, served from the parsed row cache.
 
-    if response.status_code != 200:
-        return f"Failed to download Excel file: {response.text}", 400
+    Query parameters: limit (default LESSONS_PAGE_SIZE, at most
+    LESSONS_PAGE_MAX), cursor (next_cursor of the previous page),
+    columns (comma-separated headers, default all), sort ("-date", newest
+    first, or "date"), and the /lessons filters. Responds with
+    {"columns", "lessons" (rows as lists), "next_cursor"}; next_cursor is
+    null on the last page.
+    """
+    user_id = _current_user_id()
+    token = _get_access_token() if user_id else None
+    if not token:
+        return jsonify({"status": "error", "message": "Not signed in"}), 401
 
-    # Load workbook from response content
     try:
-        workbook = openpyxl.load_workbook(filename=BytesIO(response.content))
-        sheet = workbook["lesson log"]
-    except Exception as e:
-        return f"Error reading Excel file: {e}", 500
+        sort = request.args.get("sort", "-date")
+        if sort not in ("date", "-date"):
+            raise LessonFetchError("sort must be 'date' or '-date'", 400)
+        descending = sort == "-date"
+        try:
+            limit = int(request.args.get("limit", LESSONS_PAGE_SIZE))
+        except ValueError:
+            raise LessonFetchError("limit must be a number", 400)
+        limit = max(1, min(limit, LESSONS_PAGE_MAX))
+        filters = _parse_filters()
+
+        etag, index = _open_lesson_index(user_id, token)
+        columns = index.headers
+        if request.args.get("columns"):
+            columns = [column.strip() for column in request.args["columns"].split(",")]
+            unknown = [column for column in columns if column not in index.headers]
+            if unknown:
+                raise LessonFetchError(f"Unknown column(s): {', '.join(unknown)}", 400)
+        positions = [index.headers.index(column) for column in columns]
+
+        # A cursor from a rebuilt index must get its 410, not a 304
+        cursor = request.args.get("cursor")
+        after = _decode_cursor(cursor, index, descending) if cursor else None
+
+        page_etag = http_cache.make_etag(user_id, etag, index.generation, request.full_path)
+        if etag and http_cache.is_fresh(page_etag):
+            return http_cache.not_modified(page_etag)
+        with timing.span("index_query"):
+            rows, last_key = index.page(limit, after=after, descending=descending, **filters)
+    except LessonFetchError as e:
+        return jsonify({"status": "error", "message": str(e)}), e.status
+
+    response = jsonify({
+        "columns": columns,
+        "lessons": [[_json_cell(row[i]) for i in positions] for row in rows],
+        "next_cursor": _encode_cursor(index, descending, last_key),
+    })
+    if etag:
+        http_cache.set_etag(response, page_etag)
+    return response
+
+
+@app.route("/form-data")
+def form_data():
+    """Returns the dropdown lists (athletes, durations, lesson types, focus areas) from OneDrive.
 
-    # Extract lessons starting from row 2 (skipping headers)
-    lessons = [
-        list(row)
-        for row in sheet.iter_rows(min_row=2, values_only=True)
-        if any(row)  # skip completely empty rows
-    ]
+    Answers 304 while the workbook's tag is unchanged.
+    """
+    user_id = _current_user_id()
+    token = _get_access_token() if user_id else None
+    if not token:
+        return jsonify({"status": "error", "message": "Not signed in"}), 401
+
+    try:
+        # A revalidating browser only needs the item tag, not the lists
+        if request.if_none_match:
+            with timing.span("graph_metadata"):
+                item_tag = graph_workbook.get_item_tag(token)
+            lists_etag = http_cache.make_etag(user_id, item_tag)
+            if item_tag and http_cache.is_fresh(lists_etag):
+                return http_cache.not_modified(lists_etag)
+        with timing.span("graph_range"):
+            item_tag, _, lists = graph_workbook.fetch_tracker(user_id, token, lessons=False)
+    except (graph_workbook.WorkbookError, requests.RequestException) as e:
+        print(f"Reading the dropdown lists failed: {e}")
+        return jsonify({"status": "error", "message": f"Failed to read the workbook: {e}"}), 502
+    response = jsonify(lists)
+    if item_tag:
+        http_cache.set_etag(response, http_cache.make_etag(user_id, item_tag))
+    return response
+
+
+def _lesson_errors(lessons):
+    """Returns a message per lesson that can't be written, e.g. a missing field or bad date."""
+    errors = []
+    for number, lesson in enumerate(lessons, start=1):
+        if not isinstance(lesson, dict):
+            errors.append(f"Lesson {number}: expected an object")
+            continue
+        missing = [field for field in lesson_log.LESSON_COLUMNS if not lesson.get(field)]
+        if missing:
+            errors.append(f"Lesson {number}: missing {', '.join(missing)}")
+            continue
+        try:
+            datetime.date.fromisoformat(str(lesson["date"]))
+        except ValueError:
+            errors.append(f"Lesson {number}: invalid date '{lesson['date']}', expected YYYY-MM-DD")
+    return errors
+
+
+@app.route("/commit-lessons", methods=["POST"])
+def commit_lessons():
+    """Appends lessons to 'lesson log' in OneDrive through the Graph workbook API.
+
+    Expects JSON {"lessons": [{"date", "athlete", "duration", "lesson_type",
+    "focus_area"}, ...]}. Only the new rows are sent, so a commit costs the
+    same however large the workbook is.
+    """
+    user_id = _current_user_id()
+    token = _get_access_token() if user_id else None
+    if not token:
+        return jsonify({"status": "error", "message": "Not signed in"}), 401
+
+    lessons = (request.get_json(silent=True) or {}).get("lessons")
+    if not isinstance(lessons, list) or not lessons:
+        return jsonify({"status": "error", "message": "Expected a non-empty 'lessons' list"}), 400
+    errors = _lesson_errors(lessons)
+    if errors:
+        return jsonify({"status": "error", "message": "Invalid lessons", "errors": errors}), 400
+
+    try:
+        with timing.span("graph_append"):
+            graph_workbook.append_lessons(user_id, token, lessons, table=LESSON_LOG_TABLE or None)
+    except (graph_workbook.WorkbookError, requests.RequestException) as e:
+        print(f"Graph commit failed: {e}")
+        return jsonify({"status": "error", "message": f"Failed to add lessons to Excel: {e}"}), 502
 
-    return render_template("lessons.html", lessons=lessons)
+    # The workbook's tag has changed; re-read it in the background for the next page view
+    account_id = session.get("account_id")
+    if account_id:
+        prefetcher.submit(user_id, account_id)
+    return jsonify({"status": "success", "message": f"{len(lessons)} lessons added to Excel successfully!"})
 
 
 @app.route("/logout")
 def logout():
     """Logs the user out by clearing the session and redirecting to Microsoft logout."""
+    token_cache.remove_account(session.get("account_id"))
     session.clear()
     return redirect(
         f"{AUTHORITY}/oauth2/v2.0/logout?post_logout_redirect_uri={url_for('index', _external=True)}"
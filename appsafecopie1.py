@@ -1,25 +1,47 @@
-from flask import Flask, render_template, request, jsonify, session
-import pandas as pd
+from flask import Flask, Response, render_template, request, jsonify, session
 import os
-from openpyxl import load_workbook
 import uuid
 import sys
+import threading
+import json
+import hashlib
+import re
+import csv
+import shutil
+
+from config import (
+    CACHE_DIR,
+    COMMIT_COALESCE_WINDOW,
+    COMMIT_WAIT_TIMEOUT,
+    IMPORT_MAX_ROWS,
+    JOURNAL_FLUSH_BATCH_SIZE,
+    JOURNAL_FLUSH_INTERVAL,
+    WATCH_DEBOUNCE,
+    WATCH_POLL_INTERVAL,
+)
+from event_stream import EventBroadcaster
+from file_lock import FileLock
+from file_watcher import FileWatcher
+from lesson_journal import LessonJournal, JournalFlusher
+from pending_store import PendingStore
+import bulk_lessons
+import http_cache
+import timing
+
+# pandas and openpyxl (through invoices, workbook_snapshot and
+# add_lessons_to_excel) are imported on first use, not at startup
 
 app = Flask(__name__)
 app.secret_key = 'lesson_tracker_secret_key'  # Required for session management
+timing.init_app(app)
+http_cache.init_app(app)
 
-# Configure the path to your Excel file in OneDrive
-# Replace this path with your actual OneDrive path to the Excel file
-# Example for Windows: "C:\\Users\\YourUsername\\OneDrive\\lessonlogtest.xlsm"
-# Example for Mac: "/Users/YourUsername/OneDrive/lessonlogtest.xlsm"
-EXCEL_FILE = "/Users/MakyaBertrand/OneDrive/lessonlogtest.xlsm"  # Default local path
-
-# Check if file exists at the default path, otherwise look in OneDrive
-import os
-onedrive_path = os.path.expanduser("~/OneDrive/lessonlogtestcopie.xlsm")  # Common OneDrive path
-if not os.path.exists(EXCEL_FILE) and os.path.exists(onedrive_path):
-    EXCEL_FILE = onedrive_path
-    print(f"Using Excel file from OneDrive: {EXCEL_FILE}")
+# Path to your Excel file in OneDrive. Leave as None to have it found by
+# get_excel_file_path() on first use, or set it to your file, e.g.
+# Windows: "C:\\Users\\YourUsername\\OneDrive\\lessonlogtestcopie1.xlsm"
+# Mac: "/Users/YourUsername/OneDrive/lessonlogtestcopie1.xlsm"
+EXCEL_FILE = None
+_excel_file_lock = threading.Lock()
 
 # Dynamically determine the Excel file path based on OS
 def get_excel_file_path():
@@ -68,81 +90,128 @@ def get_excel_file_path():
     # Return the current directory path as a fallback
     return current_dir_file
 
-# Set the Excel file path
-EXCEL_FILE = get_excel_file_path()
-print(f"Using Excel file: {EXCEL_FILE}")
+def get_excel_file():
+    """Return the Excel file path, resolving it once on first use.
+
+    Resolution probes OneDrive folders, which can block while the sync
+    provider wakes up, so it is kept off the import path.
+    """
+    global EXCEL_FILE
+    if EXCEL_FILE is None:
+        with _excel_file_lock:
+            if EXCEL_FILE is None:
+                EXCEL_FILE = get_excel_file_path()
+                print(f"Using Excel file: {EXCEL_FILE}")
+    return EXCEL_FILE
+
+# Pending lessons live in a server-side store; the session cookie only carries
+# the id of this browser's store. Every change bumps the store's version.
+pending_store = PendingStore(os.path.join(CACHE_DIR, 'pending-lessons.sqlite3'))
+
+def get_pending_store_id():
+    if 'pending_id' not in session:
+        session['pending_id'] = str(uuid.uuid4())
+    return session['pending_id']
 
-# Create a session-based storage for pending lessons
 def get_pending_lessons():
-    if 'pending_lessons' not in session:
-        session['pending_lessons'] = {}
-    return session['pending_lessons']
+    """Return (pending lessons in the order they were added, store version)."""
+    return pending_store.list(get_pending_store_id())
 
 def add_pending_lesson(lesson_data):
-    pending_lessons = get_pending_lessons()
+    """Queue a lesson. Returns (lesson_id, new version)."""
     lesson_id = str(uuid.uuid4())
     lesson_data['id'] = lesson_id
-    pending_lessons[lesson_id] = lesson_data
-    session['pending_lessons'] = pending_lessons
-    session.modified = True
-    return lesson_id
+    version = pending_store.add(get_pending_store_id(), lesson_id, lesson_data)
+    return lesson_id, version
 
 def update_pending_lesson(lesson_id, lesson_data):
-    pending_lessons = get_pending_lessons()
-    if lesson_id in pending_lessons:
-        lesson_data['id'] = lesson_id
-        pending_lessons[lesson_id] = lesson_data
-        session['pending_lessons'] = pending_lessons
-        session.modified = True
-        return True
-    return False
+    """Replace a queued lesson. Returns the new version, or None if it doesn't exist."""
+    lesson_data['id'] = lesson_id
+    return pending_store.update(get_pending_store_id(), lesson_id, lesson_data)
 
 def delete_pending_lesson(lesson_id):
-    pending_lessons = get_pending_lessons()
-    if lesson_id in pending_lessons:
-        del pending_lessons[lesson_id]
-        session['pending_lessons'] = pending_lessons
-        session.modified = True
-        return True
-    return False
+    """Remove a queued lesson. Returns the new version, or None if it doesn't exist."""
+    return pending_store.remove(get_pending_store_id(), [lesson_id])
+
+def remove_pending_lessons(lesson_ids):
+    """Remove lessons once they are committed, leaving any queued meanwhile."""
+    return pending_store.remove(get_pending_store_id(), lesson_ids)
+
+# Process-level cache of the parsed reference lists. It is keyed on the
+# workbook's fingerprint so that saving the file (from Excel, OneDrive sync or
+# add_lessons_to_excel) invalidates it on the next request.
+_excel_data_cache = {'fingerprint': None, 'data': None}
+_excel_data_lock = threading.Lock()
 
-def clear_pending_lessons():
-    session['pending_lessons'] = {}
-    session.modified = True
+def get_file_fingerprint(path):
+    """Return (path, inode, size, mtime) for a file, or None if it does not exist."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (path, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+def _copy_excel_data(data):
+    # Callers add keys (e.g. pending_lessons) to the result, so never hand out the cached dict
+    return {key: list(value) for key, value in data.items()}
 
 def get_excel_data():
     """Read data from 'list info' and 'skater info' sheets"""
+    fingerprint = get_file_fingerprint(get_excel_file())
+    cached = _excel_data_cache
+    if fingerprint is not None and cached['fingerprint'] == fingerprint:
+        return _copy_excel_data(cached['data'])
+
+    with _excel_data_lock:
+        # Another thread may have parsed the same version while we waited
+        if fingerprint is not None and _excel_data_cache['fingerprint'] == fingerprint:
+            return _copy_excel_data(_excel_data_cache['data'])
+        with timing.span('reference_lists'):
+            data = _read_excel_data(get_excel_file(), fingerprint)
+        if data is not None:
+            _excel_data_cache['fingerprint'] = fingerprint
+            _excel_data_cache['data'] = data
+            return _copy_excel_data(data)
+
+    return {
+        'athletes': [],
+        'durations': [],
+        'lesson_types': [],
+        'focus_areas': [],
+        'sheet_names': []
+    }
+
+def _read_excel_data(excel_file, fingerprint):
+    """Read the reference lists from the workbook's columnar snapshot. Returns None on failure."""
     try:
-        print(f"Trying to load Excel file from: {EXCEL_FILE}")
+        import workbook_snapshot
+
+        print(f"Trying to load Excel file from: {excel_file}")
         
         # Check if file exists
-        if not os.path.exists(EXCEL_FILE):
-            print(f"Error: Excel file not found at {EXCEL_FILE}")
-            return {
-                'athletes': [],
-                'durations': [],
-                'lesson_types': [],
-                'focus_areas': [],
-                'sheet_names': []
-            }
+        if fingerprint is None:
+            print(f"Error: Excel file not found at {excel_file}")
+            return None
         
-        excel_file = pd.ExcelFile(EXCEL_FILE, engine='openpyxl')
+        # Parses the workbook only the first time this version is seen, then
+        # loads just the columns used below
+        snapshot = workbook_snapshot.get_snapshot(excel_file, fingerprint)
 
         # Read from 'skater info' for athletes
-        if 'skater info' in excel_file.sheet_names:
-            skater_df = pd.read_excel(EXCEL_FILE, sheet_name='skater info', engine='openpyxl')
-            athlete_col = next((col for col in skater_df.columns if any(name in col.lower() for name in ['name', 'athlete', 'student'])), skater_df.columns[0])
-            athletes = skater_df[athlete_col].dropna().tolist()
+        if snapshot.has_sheet('skater info'):
+            columns = snapshot.columns('skater info')
+            athlete_col = next((col for col in columns if any(name in col.lower() for name in ['name', 'athlete', 'student'])), columns[0])
+            athletes = snapshot.column('skater info', athlete_col).dropna().tolist()
         else:
             print("Warning: 'skater info' sheet not found")
             athletes = []
 
         # Read from 'list info' for durations, lesson types, focus areas
-        if 'list info' in excel_file.sheet_names:
-            list_df = pd.read_excel(EXCEL_FILE, sheet_name='list info', engine='openpyxl')
-            durations = list_df['Durations'].dropna().tolist() if 'Durations' in list_df.columns else []
-            lesson_types = list_df['Lesson Types'].dropna().tolist() if 'Lesson Types' in list_df.columns else []
-            focus_areas = list_df['Focus Areas'].dropna().tolist() if 'Focus Areas' in list_df.columns else []
+        if snapshot.has_sheet('list info'):
+            list_columns = snapshot.columns('list info')
+            durations = snapshot.column('list info', 'Durations').dropna().tolist() if 'Durations' in list_columns else []
+            lesson_types = snapshot.column('list info', 'Lesson Types').dropna().tolist() if 'Lesson Types' in list_columns else []
+            focus_areas = snapshot.column('list info', 'Focus Areas').dropna().tolist() if 'Focus Areas' in list_columns else []
         else:
             print("Warning: 'list info' sheet not found")
             durations = []
@@ -155,54 +224,95 @@ def get_excel_data():
             'durations': durations,
             'lesson_types': lesson_types,
             'focus_areas': focus_areas,
-            'sheet_names': excel_file.sheet_names
+            'sheet_names': list(snapshot.sheet_names)
         }
     except Exception as e:
-        print(f"Error reading Excel file at {EXCEL_FILE}: {e}")
-        return {
-            'athletes': [],
-            'durations': [],
-            'lesson_types': [],
-            'focus_areas': [],
-            'sheet_names': []
+        print(f"Error reading Excel file at {excel_file}: {e}")
+        return None
+
+# The append index remembers where the next lesson goes and which column holds
+# what, so commits don't have to rescan the sheet. It is only trusted while the
+# workbook's fingerprint matches the one recorded after our last save.
+def _append_index_path():
+    digest = hashlib.sha256(get_excel_file().encode('utf-8')).hexdigest()[:16]
+    return os.path.join(CACHE_DIR, f"append-index-{digest}.json")
+
+def load_append_index(fingerprint):
+    """Return the saved {'next_row', 'header_map'} if it was written for this exact file version."""
+    try:
+        with open(_append_index_path(), encoding='utf-8') as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if fingerprint is None or index.get('fingerprint') != list(fingerprint):
+        return None
+    return index
+
+def save_append_index(fingerprint, next_row, header_map):
+    """Persist the append position and header map for the given file version."""
+    path = _append_index_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'fingerprint': list(fingerprint), 'next_row': next_row, 'header_map': header_map}, f)
+    os.replace(tmp_path, path)
+
+def scan_lesson_log(sheet):
+    """Build the header map from row 1 and find the first empty Date row (full rescan)."""
+    # Get headers from the first row
+    headers = [cell.value for cell in sheet[1]]
+    print(f"Found headers: {headers}")
+
+    try:
+        # Create a map of expected columns
+        header_map = {
+            'date': headers.index('Date'),
+            'athlete': headers.index("Athlete's Name"),
+            'duration': headers.index('Durations'),
+            'lesson_type': headers.index('Lesson Types'),
+            'focus_area': headers.index('Focus Areas')
         }
+    except ValueError as e:
+        print(f"Error mapping headers: {e}. Headers found: {headers}")
+        return None, None
+
+    # Find the first empty row starting from row 2
+    row = 2
+    while sheet.cell(row=row, column=header_map['date'] + 1).value:  # Check if Date column is not empty
+        row += 1
+    return header_map, row
 
 def add_lessons_to_excel(lessons):
     """Add multiple lesson records to the 'lesson log' sheet in the Excel file"""
     try:
+        from openpyxl import load_workbook
+
         # Check if file exists
-        if not os.path.exists(EXCEL_FILE):
-            print(f"Error: Excel file not found at {EXCEL_FILE}")
+        excel_file = get_excel_file()
+        fingerprint = get_file_fingerprint(excel_file)
+        if fingerprint is None:
+            print(f"Error: Excel file not found at {excel_file}")
             return False
+
+        index = load_append_index(fingerprint)
             
-        wb = load_workbook(EXCEL_FILE, keep_vba=True)
+        with timing.span('excel_load'):
+            wb = load_workbook(excel_file, keep_vba=True)
         if 'lesson log' not in wb.sheetnames:
             print("Error: 'lesson log' sheet not found.")
             return False
 
         sheet = wb['lesson log']
 
-        # Get headers from the first row
-        headers = [cell.value for cell in sheet[1]]
-        print(f"Found headers: {headers}")
-
-        try:
-            # Create a map of expected columns
-            header_map = {
-                'date': headers.index('Date'),
-                'athlete': headers.index("Athlete's Name"),
-                'duration': headers.index('Durations'),
-                'lesson_type': headers.index('Lesson Types'),
-                'focus_area': headers.index('Focus Areas')
-            }
-        except ValueError as e:
-            print(f"Error mapping headers: {e}. Headers found: {headers}")
-            return False
-
-        # Find the first empty row starting from row 2
-        row = 2
-        while sheet.cell(row=row, column=1).value:  # Check if Date column is not empty
-            row += 1
+        if index is not None:
+            header_map, row = index['header_map'], index['next_row']
+        else:
+            # File changed outside this app (or first commit): rescan the sheet
+            print("Append index missing or stale, rescanning 'lesson log'")
+            with timing.span('row_scan'):
+                header_map, row = scan_lesson_log(sheet)
+            if header_map is None:
+                return False
 
         # Insert all lessons
         for lesson_data in lessons:
@@ -213,23 +323,117 @@ def add_lessons_to_excel(lessons):
             sheet.cell(row=row, column=header_map['focus_area'] + 1, value=lesson_data['focus_area'])
             row += 1
 
-        wb.save(EXCEL_FILE)
+        with timing.span('excel_save'):
+            wb.save(excel_file)
         print(f"Successfully added {len(lessons)} lessons to Excel file")
+
+        try:
+            save_append_index(get_file_fingerprint(excel_file), row, header_map)
+        except OSError as e:
+            # Not fatal: the next commit just falls back to a rescan
+            print(f"Warning: could not save append index: {e}")
         return True
     except Exception as e:
         print(f"Error adding lessons to Excel: {e}")
         return False
-       
+
+# Committed lessons land in the journal first; the flusher writes them to the
+# workbook, coalescing commits made within a short window (across all workers)
+# into one save. It starts with the first request and replays anything a
+# previous run left unflushed.
+lesson_journal = LessonJournal(os.path.join(CACHE_DIR, 'lesson-journal.sqlite3'))
+journal_flusher = JournalFlusher(
+    lesson_journal,
+    add_lessons_to_excel,
+    batch_size=JOURNAL_FLUSH_BATCH_SIZE,
+    interval=JOURNAL_FLUSH_INTERVAL,
+    window=COMMIT_COALESCE_WINDOW,
+)
+
+@app.before_request
+def start_journal_flusher():
+    journal_flusher.start()
+
+# The watcher re-warms the caches as soon as the workbook changes on disk (an
+# edit in Excel, OneDrive sync or our own flush) and tells connected browsers
+# what changed over /events, so they refresh only when they need to.
+workbook_events = EventBroadcaster()
+_workbook_state = {'reference_lists': None, 'lesson_log': None}
+
+def _read_workbook_state():
+    """Return (reference lists, lesson log digest) for the workbook as it is now, or None if unreadable."""
+    import workbook_snapshot
+
+    excel_file = get_excel_file()
+    fingerprint = get_file_fingerprint(excel_file)
+    data = get_excel_data()
+    if fingerprint is None or _excel_data_cache['fingerprint'] != fingerprint:
+        # Missing, mid-save, or changed again while we read it
+        return None
+    snapshot = workbook_snapshot.get_snapshot(excel_file, fingerprint)
+    lesson_log_digest = snapshot.digest('lesson log') if snapshot.has_sheet('lesson log') else None
+    return data, lesson_log_digest
+
+def _on_workbook_changed():
+    with timing.span('watch_rewarm'):
+        state = _read_workbook_state()
+    if state is None:
+        return False
+    reference_lists, lesson_log_digest = state
+    first_read = _workbook_state['reference_lists'] is None
+    if not first_read and reference_lists != _workbook_state['reference_lists']:
+        workbook_events.publish('reference-lists')
+    if not first_read and lesson_log_digest != _workbook_state['lesson_log']:
+        workbook_events.publish('lesson-log')
+    _workbook_state['reference_lists'] = reference_lists
+    _workbook_state['lesson_log'] = lesson_log_digest
+    return True
+
+workbook_watcher = FileWatcher(
+    get_excel_file,
+    _on_workbook_changed,
+    poll_interval=WATCH_POLL_INTERVAL,
+    debounce=WATCH_DEBOUNCE,
+)
+
+@app.before_request
+def start_workbook_watcher():
+    workbook_watcher.start()
+
 @app.route('/')
 def index():
     return render_template('index.html')
 
 @app.route('/form-data')
 def form_data():
+    # The response only depends on the workbook version and this browser's
+    # pending lessons, so an unchanged reload gets a 304 without reading either
+    store_id = get_pending_store_id()
+    etag = http_cache.make_etag(get_file_fingerprint(get_excel_file()), store_id, pending_store.version(store_id))
+    if http_cache.is_fresh(etag):
+        return http_cache.not_modified(etag)
     data = get_excel_data()
     # Include pending lessons in the response
-    data['pending_lessons'] = list(get_pending_lessons().values())
-    return jsonify(data)
+    data['pending_lessons'], data['pending_version'] = get_pending_lessons()
+    response = jsonify(data)
+    if data['sheet_names']:  # don't let a browser hold on to the empty lists of a failed read
+        http_cache.set_etag(response, etag)
+    return response
+
+@app.route('/events')
+def workbook_event_stream():
+    # One long-lived text/event-stream per open page
+    return Response(
+        workbook_events.stream(),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/pending-lessons')
+def pending_lessons_list():
+    # Lets a client that missed a version resync without re-reading the workbook
+    lessons, version = get_pending_lessons()
+    return jsonify({'pending_lessons': lessons, 'pending_version': version})
 
 @app.route('/submit-lesson', methods=['POST'])
 def submit_lesson():
@@ -243,13 +447,14 @@ def submit_lesson():
         }
         
         # Add to pending lessons
-        lesson_id = add_pending_lesson(lesson_data)
+        lesson_id, version = add_pending_lesson(lesson_data)
         
         return jsonify({
             'status': 'success', 
             'message': 'Lesson added to pending list!',
             'lesson_id': lesson_id,
-            'pending_lessons': list(get_pending_lessons().values())
+            'lesson': lesson_data,
+            'pending_version': version
         })
 
 @app.route('/update-lesson', methods=['POST'])
@@ -264,19 +469,20 @@ def update_lesson():
             'focus_area': request.form['focus_area']
         }
         
-        success = update_pending_lesson(lesson_id, lesson_data)
+        version = update_pending_lesson(lesson_id, lesson_data)
         
-        if success:
+        if version is not None:
             return jsonify({
                 'status': 'success', 
                 'message': 'Lesson updated successfully!',
-                'pending_lessons': list(get_pending_lessons().values())
+                'lesson': lesson_data,
+                'pending_version': version
             })
         else:
             return jsonify({
                 'status': 'error', 
                 'message': 'Failed to update lesson.',
-                'pending_lessons': list(get_pending_lessons().values())
+                'pending_version': pending_store.version(get_pending_store_id())
             })
 
 @app.route('/delete-lesson', methods=['POST'])
@@ -284,25 +490,26 @@ def delete_lesson():
     if request.method == 'POST':
         lesson_id = request.form['id']
         
-        success = delete_pending_lesson(lesson_id)
+        version = delete_pending_lesson(lesson_id)
         
-        if success:
+        if version is not None:
             return jsonify({
                 'status': 'success', 
                 'message': 'Lesson deleted successfully!',
-                'pending_lessons': list(get_pending_lessons().values())
+                'lesson_id': lesson_id,
+                'pending_version': version
             })
         else:
             return jsonify({
                 'status': 'error', 
                 'message': 'Failed to delete lesson.',
-                'pending_lessons': list(get_pending_lessons().values())
+                'pending_version': pending_store.version(get_pending_store_id())
             })
 
 @app.route('/commit-lessons', methods=['POST'])
 def commit_lessons():
     if request.method == 'POST':
-        pending_lessons = list(get_pending_lessons().values())
+        pending_lessons, _ = get_pending_lessons()
         
         if not pending_lessons:
             return jsonify({
@@ -310,20 +517,183 @@ def commit_lessons():
                 'message': 'No pending lessons to commit.'
             })
         
-        success = add_lessons_to_excel(pending_lessons)
-        
-        if success:
-            # Clear pending lessons after successful commit
-            clear_pending_lessons()
-            return jsonify({
-                'status': 'success', 
-                'message': f'{len(pending_lessons)} lessons added to Excel successfully!'
-            })
-        else:
+        try:
+            with timing.span('journal_append'):
+                entry_ids = lesson_journal.append(pending_lessons)
+        except Exception as e:
+            print(f"Error journaling lessons: {e}")
             return jsonify({
                 'status': 'error', 
-                'message': 'Failed to add lessons to Excel file.'
+                'message': 'Failed to save lessons.'
             })
+        
+        # Lessons are durable in the journal, so drop them and let the flusher write the workbook
+        version = remove_pending_lessons([lesson['id'] for lesson in pending_lessons])
+        journal_flusher.notify()
+
+        # Wait for the save this commit shares with any others made meanwhile
+        with timing.span('commit_wait'):
+            written = journal_flusher.wait_flushed(entry_ids, COMMIT_WAIT_TIMEOUT)
+        if written:
+            message = f'{len(pending_lessons)} lessons added to Excel successfully!'
+        else:
+            message = f'{len(pending_lessons)} lessons saved! They will be added to Excel shortly.'
+        return jsonify({
+            'status': 'success', 
+            'message': message,
+            'written': written,
+            'pending_version': version
+        })
+
+@app.route('/lessons/import', methods=['POST'])
+def import_lessons():
+    """Validate an uploaded CSV or NDJSON file of lessons and commit the valid ones in one batch.
+
+    The file can be sent as the 'file' field of a form upload or as the raw
+    request body; ?format=csv|ndjson overrides detection from its name/type.
+    """
+    upload = request.files.get('file')
+    stream = upload.stream if upload else request.stream
+    try:
+        fmt = bulk_lessons.detect_format(
+            request.args.get('format'),
+            upload.filename if upload else None,
+            upload.mimetype if upload else request.mimetype
+        )
+    except bulk_lessons.ImportFormatError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
+    reference = get_excel_data()
+    if not reference['athletes']:
+        return jsonify({'status': 'error', 'message': 'Could not read the reference lists from Excel.'}), 503
+
+    lessons = []
+    errors = []
+    rejected = 0
+    try:
+        with timing.span('import_parse'):
+            records = bulk_lessons.iter_records(stream, fmt)
+            for line, lesson, error in bulk_lessons.validate(records, reference):
+                if error:
+                    rejected += 1
+                    if len(errors) < 50:
+                        errors.append({'line': line, 'message': error})
+                    continue
+                lessons.append(lesson)
+                if len(lessons) > IMPORT_MAX_ROWS:
+                    return jsonify({
+                        'status': 'error',
+                        'message': f'Too many lessons in one import (limit {IMPORT_MAX_ROWS}).'
+                    }), 413
+    except (bulk_lessons.ImportFormatError, UnicodeDecodeError, csv.Error) as e:
+        return jsonify({'status': 'error', 'message': f'Could not read the upload: {e}'}), 400
+
+    if not lessons:
+        return jsonify({
+            'status': 'error',
+            'message': 'No valid lessons to import.',
+            'rejected': rejected,
+            'errors': errors
+        }), 400
+
+    # Same path as /commit-lessons: one journal transaction, then a group-committed save
+    try:
+        with timing.span('journal_append'):
+            entry_ids = lesson_journal.append(lessons)
+    except Exception as e:
+        print(f"Error journaling imported lessons: {e}")
+        return jsonify({'status': 'error', 'message': 'Failed to save lessons.'}), 500
+    journal_flusher.notify()
+    with timing.span('commit_wait'):
+        written = journal_flusher.wait_flushed(entry_ids, COMMIT_WAIT_TIMEOUT)
+
+    if written:
+        message = f'{len(lessons)} lessons imported to Excel successfully!'
+    else:
+        message = f'{len(lessons)} lessons imported! They will be added to Excel shortly.'
+    return jsonify({
+        'status': 'success',
+        'message': message,
+        'imported': len(lessons),
+        'rejected': rejected,
+        'errors': errors,
+        'written': written
+    })
+
+@app.route('/lessons/export')
+def export_lessons():
+    """Stream 'lesson log' as CSV, or NDJSON with ?format=ndjson, without loading it into memory."""
+    import lesson_log
+
+    fmt = request.args.get('format', 'csv')
+    if fmt not in bulk_lessons.FORMATS:
+        return jsonify({'status': 'error', 'message': 'format must be csv or ndjson'}), 400
+    excel_file = get_excel_file()
+    fingerprint = get_file_fingerprint(excel_file)
+    if fingerprint is None:
+        return jsonify({'status': 'error', 'message': f'Excel file not found at {excel_file}'}), 404
+    etag = http_cache.make_etag(fingerprint, fmt)
+    if http_cache.is_fresh(etag):
+        return http_cache.not_modified(etag)
+
+    # Read from a private copy, taken while no flush is saving the workbook, so
+    # a save during a slow download can't hand the reader a half-written file
+    export_dir = os.path.join(CACHE_DIR, 'exports')
+    os.makedirs(export_dir, exist_ok=True)
+    copy_path = os.path.join(export_dir, f"{uuid.uuid4()}{os.path.splitext(excel_file)[1]}")
+    try:
+        with FileLock(journal_flusher.lock_path):
+            shutil.copyfile(excel_file, copy_path)
+        headers, rows = lesson_log.iter_lesson_rows(copy_path)
+    except Exception as e:
+        if os.path.exists(copy_path):
+            os.remove(copy_path)
+        print(f"Error exporting lessons: {e}")
+        return jsonify({'status': 'error', 'message': f'Failed to read the lesson log: {e}'}), 500
+
+    def generate():
+        try:
+            yield from bulk_lessons.export_rows(headers, rows, fmt)
+        finally:
+            rows.close()
+            os.remove(copy_path)
+
+    response = Response(
+        generate(),
+        mimetype=bulk_lessons.FORMATS[fmt],
+        headers={'Content-Disposition': f'attachment; filename=lessons.{fmt}'}
+    )
+    return http_cache.set_etag(response, etag)
+
+@app.route('/invoices')
+def invoices_report():
+    """Invoice totals per athlete and month, as JSON or (?format=csv) line-item CSV."""
+    month = request.args.get('month')
+    if month is not None and not re.fullmatch(r'\d{4}-(0[1-9]|1[0-2])', month):
+        return jsonify({'status': 'error', 'message': 'month must be YYYY-MM'}), 400
+
+    import invoices
+
+    excel_file = get_excel_file()
+    fingerprint = get_file_fingerprint(excel_file)
+    if fingerprint is None:
+        return jsonify({'status': 'error', 'message': f'Excel file not found at {excel_file}'}), 404
+
+    try:
+        with timing.span('invoices'):
+            payload = invoices.build_invoices(excel_file, fingerprint, month)
+    except Exception as e:
+        print(f"Error building invoices: {e}")
+        return jsonify({'status': 'error', 'message': f'Failed to build invoices: {e}'}), 500
+
+    if request.args.get('format') == 'csv':
+        filename = f"invoices-{month or 'all'}.csv"
+        return Response(
+            invoices.lines_to_csv(payload),
+            mimetype='text/csv',
+            headers={'Content-Disposition': f'attachment; filename={filename}'}
+        )
+    return jsonify(payload)
 
 if __name__ == '__main__':
     # Ensure the templates directory exists
@@ -439,6 +809,29 @@ if __name__ == '__main__':
     </div>
 
     <script>
+        // Pending lessons as last returned by the server, used by editLesson
+        let pendingLessons = [];
+        // Version of the server-side pending store that pendingLessons reflects
+        let pendingVersion = 0;
+        
+        // Apply a change the server made to the pending store. Responses only
+        // carry the changed lesson, so if we missed a version reload the list.
+        async function applyPendingChange(version, change) {
+            if (version === pendingVersion + 1) {
+                pendingVersion = version;
+                displayPendingLessons(change(pendingLessons.slice()));
+                return;
+            }
+            try {
+                const response = await fetch('/pending-lessons');
+                const data = await response.json();
+                pendingVersion = data.pending_version;
+                displayPendingLessons(data.pending_lessons);
+            } catch (error) {
+                showMessage('Error loading pending lessons: ' + error.message, 'error');
+            }
+        }
+        
         // Fetch form data from the server
         async function fetchFormData() {
             try {
@@ -455,6 +848,7 @@ if __name__ == '__main__':
                 populateDropdown('focus_area', data.focus_areas);
                 
                 // Display pending lessons
+                pendingVersion = data.pending_version || 0;
                 displayPendingLessons(data.pending_lessons || []);
             } catch (error) {
                 showMessage('Error loading form data: ' + error.message, 'error');
@@ -482,6 +876,8 @@ if __name__ == '__main__':
         // Populate a dropdown with options
         function populateDropdown(id, options) {
             const dropdown = document.getElementById(id);
+            // Keep what the user already picked if it is still an option
+            const selected = dropdown.value;
             
             // Keep the first option (placeholder)
             const placeholder = dropdown.options[0];
@@ -495,10 +891,41 @@ if __name__ == '__main__':
                 optionElement.textContent = option;
                 dropdown.appendChild(optionElement);
             });
+            if (options.includes(selected)) {
+                dropdown.value = selected;
+            }
+        }
+        
+        // Live updates: the server says when the workbook changed, so there is no polling
+        let workbookVersion = null;
+        function listenForWorkbookChanges() {
+            if (!window.EventSource) {
+                return;
+            }
+            const events = new EventSource('/events');
+            events.addEventListener('ready', event => {
+                const version = JSON.parse(event.data).version;
+                // Reconnected after missing changes: catch up once
+                if (workbookVersion !== null && version !== workbookVersion) {
+                    fetchFormData();
+                }
+                workbookVersion = version;
+            });
+            events.addEventListener('reference-lists', event => {
+                workbookVersion = JSON.parse(event.data).version;
+                fetchFormData();
+            });
+            events.addEventListener('lesson-log', event => {
+                workbookVersion = JSON.parse(event.data).version;
+                const fileStatus = document.getElementById('fileStatus');
+                fileStatus.textContent = 'Lesson log updated at ' + new Date().toLocaleTimeString();
+                fileStatus.className = 'file-status success';
+            });
         }
         
         // Display pending lessons in the table
         function displayPendingLessons(lessons) {
+            pendingLessons = lessons;
             const tbody = document.querySelector('#pendingLessonsTable tbody');
             tbody.innerHTML = '';
             
@@ -579,7 +1006,16 @@ if __name__ == '__main__':
                     document.querySelector('button[type="submit"]').textContent = 'Add Lesson';
                     
                     // Update pending lessons display
-                    displayPendingLessons(result.pending_lessons);
+                    const lesson = result.lesson;
+                    await applyPendingChange(result.pending_version, lessons => {
+                        const index = lessons.findIndex(l => l.id === lesson.id);
+                        if (index === -1) {
+                            lessons.push(lesson);
+                        } else {
+                            lessons[index] = lesson;
+                        }
+                        return lessons;
+                    });
                 } else {
                     showMessage(result.message, 'error');
                 }
@@ -589,31 +1025,26 @@ if __name__ == '__main__':
         });
         
         // Edit a lesson
-        async function editLesson(id) {
-            try {
-                const response = await fetch('/form-data');
-                const data = await response.json();
+        function editLesson(id) {
+            // Find the lesson to edit in the list we already have, no need to re-read the workbook
+            const lesson = pendingLessons.find(l => l.id === id);
+            
+            if (lesson) {
+                // Fill the form with lesson data
+                document.getElementById('date').value = lesson.date;
+                document.getElementById('athlete').value = lesson.athlete;
+                document.getElementById('duration').value = lesson.duration;
+                document.getElementById('lesson_type').value = lesson.lesson_type;
+                document.getElementById('focus_area').value = lesson.focus_area;
                 
-                // Find the lesson to edit
-                const lesson = data.pending_lessons.find(l => l.id === id);
+                // Set form to edit mode
+                document.getElementById('lessonForm').setAttribute('data-edit-id', id);
+                document.querySelector('button[type="submit"]').textContent = 'Update Lesson';
                 
-                if (lesson) {
-                    // Fill the form with lesson data
-                    document.getElementById('date').value = lesson.date;
-                    document.getElementById('athlete').value = lesson.athlete;
-                    document.getElementById('duration').value = lesson.duration;
-                    document.getElementById('lesson_type').value = lesson.lesson_type;
-                    document.getElementById('focus_area').value = lesson.focus_area;
-                    
-                    // Set form to edit mode
-                    document.getElementById('lessonForm').setAttribute('data-edit-id', id);
-                    document.querySelector('button[type="submit"]').textContent = 'Update Lesson';
-                    
-                    // Scroll to the form
-                    document.getElementById('lessonForm').scrollIntoView({ behavior: 'smooth' });
-                }
-            } catch (error) {
-                showMessage('Error loading lesson data: ' + error.message, 'error');
+                // Scroll to the form
+                document.getElementById('lessonForm').scrollIntoView({ behavior: 'smooth' });
+            } else {
+                showMessage('Lesson not found in pending list.', 'error');
             }
         }
         
@@ -634,7 +1065,7 @@ if __name__ == '__main__':
                     if (result.status === 'success') {
                         showMessage(result.message);
                         // Update pending lessons display
-                        displayPendingLessons(result.pending_lessons);
+                        await applyPendingChange(result.pending_version, lessons => lessons.filter(l => l.id !== result.lesson_id));
                     } else {
                         showMessage(result.message, 'error');
                     }
@@ -656,7 +1087,7 @@ if __name__ == '__main__':
                 if (result.status === 'success') {
                     showMessage(result.message);
                     // Refresh pending lessons (should be empty now)
-                    fetchFormData();
+                    await applyPendingChange(result.pending_version, lessons => []);
                 } else {
                     showMessage(result.message, 'error');
                 }
@@ -667,6 +1098,7 @@ if __name__ == '__main__':
         
         // Initial load
         document.addEventListener('DOMContentLoaded', fetchFormData);
+        document.addEventListener('DOMContentLoaded', listenForWorkbookChanges);
     </script>
 </body>
 </html>''')
@@ -0,0 +1,19 @@
+"""Benchmarks for the workbook read/write paths and Flask routes.
+
+Run from the repository root (needs the packages in benchmarks/requirements.txt):
+
+    pytest benchmarks                           # 1k and 10k row workbooks
+    BENCH_ROWS=1000,10000,100000,500000 pytest benchmarks
+    pytest benchmarks --benchmark-json=bench.json
+
+Each run is also saved under .benchmarks/ (pytest-benchmark autosave), so two
+commits can be compared with ``pytest-benchmark compare``. Peak traced memory
+for every case is recorded in the JSON under ``extra_info.peak_memory_mb``.
+
+Synthetic workbooks are generated once per size by generate_workbook and kept
+in benchmarks/.data/.
+
+bench_startup fails the run if importing app or appsafecopie1 takes longer
+than BENCH_STARTUP_BUDGET_MS (default 500) or loads pandas, numpy, openpyxl
+or msal eagerly.
+"""
@@ -0,0 +1,74 @@
+"""Read paths: reference lists, lesson log streaming, snapshots and invoices."""
+import appsafecopie1
+import invoices
+import lesson_log
+import workbook_snapshot
+
+
+def _consume_lesson_log(path):
+    _, rows = lesson_log.iter_lesson_rows(path)
+    return sum(1 for _ in rows)
+
+
+def bench_get_excel_data_cold(benchmark, workbook_path, monkeypatch, reset_caches, record_memory):
+    """First request after a workbook change: parse plus snapshot build."""
+    monkeypatch.setattr(appsafecopie1, "EXCEL_FILE", workbook_path)
+    benchmark.pedantic(appsafecopie1.get_excel_data, setup=reset_caches, rounds=5)
+    reset_caches()
+    record_memory(appsafecopie1.get_excel_data)
+
+
+def bench_get_excel_data_restart(benchmark, workbook_path, monkeypatch, reset_caches, record_memory):
+    """New process, snapshot already on disk: only the columns used are loaded."""
+    monkeypatch.setattr(appsafecopie1, "EXCEL_FILE", workbook_path)
+    reset_caches()
+    appsafecopie1.get_excel_data()
+
+    def drop_process_cache():
+        appsafecopie1._excel_data_cache.update(fingerprint=None, data=None)
+
+    benchmark.pedantic(appsafecopie1.get_excel_data, setup=drop_process_cache, rounds=20)
+    drop_process_cache()
+    record_memory(appsafecopie1.get_excel_data)
+
+
+def bench_get_excel_data_warm(benchmark, workbook_path, monkeypatch, reset_caches, record_memory):
+    """Repeat page load: served from the in-process cache."""
+    monkeypatch.setattr(appsafecopie1, "EXCEL_FILE", workbook_path)
+    reset_caches()
+    appsafecopie1.get_excel_data()
+    benchmark(appsafecopie1.get_excel_data)
+    record_memory(appsafecopie1.get_excel_data)
+
+
+def bench_stream_lesson_log(benchmark, workbook_path, record_memory):
+    """Read-only openpyxl pass over 'lesson log'."""
+    benchmark.pedantic(_consume_lesson_log, args=(workbook_path,), rounds=3)
+    record_memory(_consume_lesson_log, workbook_path)
+
+
+def bench_snapshot_build(benchmark, workbook_path, reset_caches, record_memory):
+    """Parse all three data sheets and write the columnar snapshot."""
+    fingerprint = appsafecopie1.get_file_fingerprint(workbook_path)
+    benchmark.pedantic(
+        workbook_snapshot.get_snapshot, args=(workbook_path, fingerprint), setup=reset_caches, rounds=3
+    )
+    reset_caches()
+    record_memory(workbook_snapshot.get_snapshot, workbook_path, fingerprint)
+
+
+def bench_build_invoices_cold(benchmark, workbook_path, reset_caches, record_memory):
+    """A month's invoices from a warm snapshot but no memoized frames or results."""
+    fingerprint = appsafecopie1.get_file_fingerprint(workbook_path)
+    reset_caches()
+    workbook_snapshot.get_snapshot(workbook_path, fingerprint)
+
+    def drop_memo():
+        invoices._frames.update(fingerprint=None, frames=None)
+        invoices._results.clear()
+
+    benchmark.pedantic(
+        invoices.build_invoices, args=(workbook_path, fingerprint, "2021-06"), setup=drop_memo, rounds=5
+    )
+    drop_memo()
+    record_memory(invoices.build_invoices, workbook_path, fingerprint, "2021-06")
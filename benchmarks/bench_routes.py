@@ -0,0 +1,89 @@
+"""Flask routes through the test client, for both apps."""
+import os
+import shutil
+
+import appsafecopie1
+
+LESSON_FORM = {
+    "date": "2024-01-15",
+    "athlete": "Athlete 001",
+    "duration": "30min",
+    "lesson_type": "Private lesson",
+    "focus_area": "Spins",
+}
+
+
+def _get(client, url):
+    response = client.get(url)
+    data = response.get_data()  # drains streamed bodies
+    assert response.status_code == 200, data[:200]
+    return data
+
+
+def bench_form_data(benchmark, local_app, reset_caches, record_memory):
+    reset_caches()
+    _get(local_app, "/form-data")
+    benchmark(_get, local_app, "/form-data")
+    record_memory(_get, local_app, "/form-data")
+
+
+def bench_submit_and_commit(benchmark, local_app, scratch_copy, monkeypatch, record_memory):
+    """Submit plus a group commit that waits for the (scratch copy) workbook save."""
+    monkeypatch.setattr(appsafecopie1, "EXCEL_FILE", scratch_copy())
+
+    def submit_and_commit():
+        for _ in range(5):
+            local_app.post("/submit-lesson", data=LESSON_FORM)
+        assert local_app.post("/commit-lessons").json["status"] == "success"
+
+    try:
+        benchmark(submit_and_commit)
+        record_memory(submit_and_commit)
+    finally:
+        # Drain the journal before EXCEL_FILE is restored
+        appsafecopie1.journal_flusher.flush()
+
+
+def bench_invoices_route(benchmark, local_app, reset_caches, record_memory):
+    reset_caches()
+    _get(local_app, "/invoices?month=2021-06")
+    benchmark(_get, local_app, "/invoices?month=2021-06")
+    record_memory(_get, local_app, "/invoices?month=2021-06")
+
+
+def _drop_user_cache():
+    shutil.rmtree(os.path.join(os.environ["LESSON_TRACKER_CACHE_DIR"], "onedrive"), ignore_errors=True)
+
+
+def bench_lessons_cold(benchmark, graph_app, reset_caches, record_memory):
+    """Full download, parse into the lesson index and render of the newest page."""
+    benchmark.pedantic(_get, args=(graph_app, "/lessons"), setup=reset_caches, rounds=3)
+    reset_caches()
+    record_memory(_get, graph_app, "/lessons")
+
+
+def bench_lessons_revalidated(benchmark, graph_app, reset_caches, record_memory):
+    """304 from Graph, newest page answered from the held lesson index."""
+    reset_caches()
+    _get(graph_app, "/lessons")
+    benchmark(_get, graph_app, "/lessons")
+    record_memory(_get, graph_app, "/lessons")
+
+
+def bench_lessons_filtered(benchmark, graph_app, reset_caches, record_memory):
+    """One athlete over a date range, answered from the lesson index."""
+    url = "/lessons?athlete=Athlete+001&from=2021-01-01&to=2021-12-31"
+    reset_caches()
+    _get(graph_app, url)
+    benchmark(_get, graph_app, url)
+    record_memory(_get, graph_app, url)
+
+
+def bench_api_lessons_next_page(benchmark, graph_app, reset_caches, record_memory):
+    """A follow-on page through /api/lessons, continued from a cursor."""
+    reset_caches()
+    first = graph_app.get("/api/lessons?limit=50&sort=date").json
+    url = f"/api/lessons?limit=50&sort=date&cursor={first['next_cursor']}"
+    _get(graph_app, url)
+    benchmark(_get, graph_app, url)
+    record_memory(_get, graph_app, url)
@@ -0,0 +1,47 @@
+"""Cold-start budget: importing either app must stay cheap.
+
+Each import runs in a fresh interpreter. The check fails when the fastest of
+the rounds goes over BENCH_STARTUP_BUDGET_MS, or when the import pulls in a
+library that is meant to load on first use.
+"""
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STARTUP_BUDGET_MS = float(os.environ.get("BENCH_STARTUP_BUDGET_MS", "500"))
+DEFERRED_MODULES = ("pandas", "numpy", "openpyxl", "msal")
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+print(json.dumps({{
+    "ms": (time.perf_counter() - start) * 1000,
+    "loaded": [name for name in {deferred!r} if name in sys.modules],
+}}))
+"""
+
+
+def _import_in_subprocess(module):
+    output = subprocess.run(
+        [sys.executable, "-c", _PROBE.format(module=module, deferred=DEFERRED_MODULES)],
+        cwd=REPO_ROOT, env=os.environ.copy(), capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+@pytest.mark.parametrize("module", ["app", "appsafecopie1"])
+def bench_import(benchmark, module):
+    results = []
+    benchmark.pedantic(lambda: results.append(_import_in_subprocess(module)), rounds=5)
+    fastest = min(result["ms"] for result in results)
+    benchmark.extra_info["import_ms"] = round(fastest, 1)
+
+    assert not results[0]["loaded"], f"import {module} loaded {results[0]['loaded']} eagerly"
+    assert fastest <= STARTUP_BUDGET_MS, (
+        f"import {module} took {fastest:.0f} ms, over the {STARTUP_BUDGET_MS:.0f} ms budget"
+    )
@@ -0,0 +1,48 @@
+"""Write paths: appending lessons to the workbook and to the journal."""
+import os
+
+import appsafecopie1
+from lesson_journal import LessonJournal
+
+LESSON = {
+    "date": "2024-01-15",
+    "athlete": "Athlete 001",
+    "duration": "30min",
+    "lesson_type": "Private lesson",
+    "focus_area": "Spins",
+}
+BATCH = [dict(LESSON) for _ in range(10)]
+
+
+def bench_add_lessons_rescan(benchmark, scratch_copy, monkeypatch, reset_caches, record_memory):
+    """Commit with no valid append index: header discovery plus first-empty-row scan."""
+
+    def setup():
+        reset_caches()
+        monkeypatch.setattr(appsafecopie1, "EXCEL_FILE", scratch_copy())
+        return (BATCH,), {}
+
+    benchmark.pedantic(appsafecopie1.add_lessons_to_excel, setup=setup, rounds=3)
+    setup()
+    record_memory(appsafecopie1.add_lessons_to_excel, BATCH)
+
+
+def bench_add_lessons_indexed(benchmark, scratch_copy, monkeypatch, reset_caches, record_memory):
+    """Commit against an unchanged file, using the persisted append index."""
+
+    def setup():
+        reset_caches()
+        monkeypatch.setattr(appsafecopie1, "EXCEL_FILE", scratch_copy())
+        appsafecopie1.add_lessons_to_excel([LESSON])  # writes the index
+        return (BATCH,), {}
+
+    benchmark.pedantic(appsafecopie1.add_lessons_to_excel, setup=setup, rounds=3)
+    setup()
+    record_memory(appsafecopie1.add_lessons_to_excel, BATCH)
+
+
+def bench_journal_append(benchmark, tmp_path, record_memory):
+    """What /commit-lessons pays on the request path."""
+    journal = LessonJournal(os.path.join(tmp_path, "journal.sqlite3"))
+    benchmark(journal.append, BATCH)
+    record_memory(journal.append, BATCH)
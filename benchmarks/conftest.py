@@ -0,0 +1,157 @@
+"""Shared fixtures: generated workbooks, isolated caches and a memory probe."""
+import os
+import shutil
+import sys
+import tempfile
+import tracemalloc
+
+import pytest
+
+# Point every cache at a scratch directory before the app modules read config
+_SCRATCH = tempfile.mkdtemp(prefix="lesson-tracker-bench-")
+os.environ["LESSON_TRACKER_CACHE_DIR"] = os.path.join(_SCRATCH, "cache")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.generate_workbook import generate_workbook  # noqa: E402
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".data")
+BENCH_ROWS = [int(n) for n in os.environ.get("BENCH_ROWS", "1000,10000").split(",") if n]
+
+
+def pytest_generate_tests(metafunc):
+    if "rows" in metafunc.fixturenames:
+        metafunc.parametrize("rows", BENCH_ROWS, scope="session")
+    if "vba" in metafunc.fixturenames:
+        metafunc.parametrize("vba", [False, True], ids=["xlsx", "xlsm"], scope="session")
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(_SCRATCH, ignore_errors=True)
+
+
+@pytest.fixture(scope="session")
+def workbook_path(rows, vba):
+    """A generated workbook of the requested size, reused across runs."""
+    os.makedirs(DATA_DIR, exist_ok=True)
+    path = os.path.join(DATA_DIR, f"lessons-{rows}.{'xlsm' if vba else 'xlsx'}")
+    if not os.path.exists(path):
+        generate_workbook(path, rows, vba=vba)
+    return path
+
+
+@pytest.fixture
+def scratch_copy(workbook_path, tmp_path):
+    """Returns a function that makes a fresh copy of the workbook for write benchmarks."""
+    counter = iter(range(1_000_000))
+
+    def make():
+        path = os.path.join(tmp_path, f"{next(counter)}-{os.path.basename(workbook_path)}")
+        shutil.copyfile(workbook_path, path)
+        return path
+
+    return make
+
+
+@pytest.fixture
+def reset_caches():
+    """Returns a function that drops every on-disk and in-process cache."""
+
+    def reset():
+        cache_dir = os.environ["LESSON_TRACKER_CACHE_DIR"]
+        for name in ("snapshots", "onedrive"):
+            shutil.rmtree(os.path.join(cache_dir, name), ignore_errors=True)
+        for name in os.listdir(cache_dir) if os.path.isdir(cache_dir) else ():
+            if name.startswith("append-index-"):
+                os.remove(os.path.join(cache_dir, name))
+        if "appsafecopie1" in sys.modules:
+            sys.modules["appsafecopie1"]._excel_data_cache.update(fingerprint=None, data=None)
+        if "invoices" in sys.modules:
+            invoices = sys.modules["invoices"]
+            invoices._frames.update(fingerprint=None, frames=None)
+            invoices._results.clear()
+        if "app" in sys.modules:
+            sys.modules["app"].lesson_indexes.clear()
+
+    return reset
+
+
+@pytest.fixture
+def record_memory(benchmark):
+    """Runs fn once under tracemalloc and stores its peak in the benchmark's extra_info."""
+
+    def record(fn, *args, **kwargs):
+        tracemalloc.start()
+        try:
+            fn(*args, **kwargs)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        benchmark.extra_info["peak_memory_mb"] = round(peak / 2**20, 2)
+
+    return record
+
+
+class FakeGraphResponse:
+    """Just enough of requests.Response for graph_client and app.py."""
+
+    def __init__(self, status_code, content=b"", headers=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+        self.history = []
+        self.text = ""
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self.content), chunk_size):
+            yield self.content[start:start + chunk_size]
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class FakeGraphSession:
+    """Serves one workbook's bytes for the content download, honouring If-None-Match."""
+
+    def __init__(self, content, etag='"bench-1"'):
+        self.content = content
+        self.etag = etag
+
+    def request(self, method, url, headers=None, timeout=None, **kwargs):
+        if url.endswith(":/content"):
+            if (headers or {}).get("If-None-Match") == self.etag:
+                return FakeGraphResponse(304)
+            return FakeGraphResponse(200, self.content, {"ETag": self.etag})
+        return FakeGraphResponse(404)
+
+
+@pytest.fixture
+def graph_app(workbook_path, monkeypatch):
+    """app.py's test client, signed in, with Graph answered from the generated workbook."""
+    import app
+    import graph_client
+
+    with open(workbook_path, "rb") as f:
+        monkeypatch.setattr(graph_client, "_session", FakeGraphSession(f.read()))
+    monkeypatch.setattr(app, "_get_access_token", lambda: "bench-token")
+    client = app.app.test_client()
+    with client.session_transaction() as session:
+        session["account_id"] = "bench"
+        session["user"] = {"oid": "bench"}
+    return client
+
+
+@pytest.fixture
+def local_app(workbook_path, monkeypatch):
+    """appsafecopie1's test client pointed at the generated workbook."""
+    import appsafecopie1
+
+    monkeypatch.setattr(appsafecopie1, "EXCEL_FILE", workbook_path)
+    # The watcher would rebuild caches in the background while they are being measured
+    monkeypatch.setattr(appsafecopie1.workbook_watcher, "start", lambda: None)
+    return appsafecopie1.app.test_client()
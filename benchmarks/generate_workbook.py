@@ -0,0 +1,93 @@
+"""Generates synthetic lesson tracker workbooks with the real sheet layout.
+
+    python -m benchmarks.generate_workbook --rows 100000 --vba out.xlsm
+
+'lesson log' gets the Date / Athlete's Name / Durations / Lesson Types /
+Focus Areas / Rate columns, 'skater info' and 'list info' mirror the sheets
+get_excel_data reads. With vba=True the VBA project from the repository's
+LessonTracker.xlsm is copied in, so the result is a real macro-enabled file.
+"""
+import argparse
+import datetime
+import os
+import random
+import zipfile
+
+import openpyxl
+
+REPO_WORKBOOK = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "LessonTracker.xlsm")
+
+LESSON_LOG_HEADERS = ["Date", "Athlete's Name", "Durations", "Lesson Types", "Focus Areas", "Rate"]
+SKATER_INFO_HEADERS = ["Athlete's Name", "Parent's Name", "Parent's Email", "Base Coach", "Level"]
+LESSON_TYPES = ["Private lesson", "Semi-Private Lesson"] + [f"Group of {n}" for n in range(3, 11)]
+FOCUS_AREAS = ["Jumps ", "Spins", "Axel", "Saw", "Toe", "Loop ", "Flip", "Ltuz", "Combos", "Harnnes"]
+DURATIONS = [f"{minutes}min" for minutes in range(5, 125, 5)]
+LEVELS = ["Comp", "Comp Dev", "Intro Star", "Star 6-Gold", "Adult"]
+HOURLY_RATE = 40
+
+
+def _group_size(lesson_type):
+    if lesson_type.startswith("Private"):
+        return 1
+    if lesson_type.startswith("Semi"):
+        return 2
+    return int(lesson_type.rsplit(" ", 1)[1])
+
+
+def generate_workbook(path, rows, vba=False, athletes=50, seed=0):
+    """Writes a workbook with `rows` lessons to path and returns the path."""
+    rng = random.Random(seed)
+    names = [f"Athlete {i:03d}" for i in range(athletes)]
+
+    wb = openpyxl.Workbook(write_only=True)
+
+    log = wb.create_sheet("lesson log")
+    log.append(LESSON_LOG_HEADERS)
+    start = datetime.date(2020, 1, 1)
+    for i in range(rows):
+        day = start + datetime.timedelta(days=i * 1500 // max(rows, 1))
+        duration = rng.choice(DURATIONS)
+        lesson_type = rng.choice(LESSON_TYPES)
+        minutes = int(duration[:-3])
+        rate = minutes / 60 * HOURLY_RATE / _group_size(lesson_type)
+        log.append([day.isoformat(), rng.choice(names), duration, lesson_type, rng.choice(FOCUS_AREAS), rate])
+
+    skaters = wb.create_sheet("skater info")
+    skaters.append(SKATER_INFO_HEADERS)
+    for name in names:
+        skaters.append([name, f"Parent of {name}", f"{name.replace(' ', '.').lower()}@example.com", None, rng.choice(LEVELS)])
+
+    lists = wb.create_sheet("list info")
+    lists.append(["Date", "Lesson Types", "Focus Areas", "Durations", None, None])
+    lists.append([None, None, None, None, None, "rat"])
+    for i, duration in enumerate(DURATIONS):
+        minutes = int(duration[:-3])
+        lists.append([
+            None,
+            LESSON_TYPES[i] if i < len(LESSON_TYPES) else None,
+            FOCUS_AREAS[i] if i < len(FOCUS_AREAS) else None,
+            duration,
+            minutes,
+            minutes / 60 * HOURLY_RATE,
+        ])
+
+    if vba:
+        # openpyxl copies the VBA part across and marks the package macro-enabled
+        wb.vba_archive = zipfile.ZipFile(REPO_WORKBOOK)
+    wb.save(path)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path")
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--vba", action="store_true", help="include a VBA project (.xlsm)")
+    parser.add_argument("--athletes", type=int, default=50)
+    args = parser.parse_args()
+    generate_workbook(args.path, args.rows, vba=args.vba, athletes=args.athletes)
+    print(f"Wrote {args.rows} lessons to {args.path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""Bulk import and export of lessons as CSV or NDJSON.
+
+Uploads are decoded one record at a time straight from the request stream
+and checked against the workbook's reference lists, so importing hundreds of
+lessons is one request and one journal batch instead of a /submit-lesson
+round trip each. Exports are produced row by row from a streaming read of
+'lesson log'.
+"""
+import csv
+import datetime
+import io
+import json
+
+FIELDS = ["date", "athlete", "duration", "lesson_type", "focus_area"]
+
+# Column names accepted for each field, compared case-insensitively: the form's
+# field names and the sheet's headers, so an export can be edited and re-imported
+FIELD_ALIASES = {
+    "date": "date",
+    "athlete": "athlete",
+    "athlete's name": "athlete",
+    "duration": "duration",
+    "durations": "duration",
+    "lesson_type": "lesson_type",
+    "lesson type": "lesson_type",
+    "lesson types": "lesson_type",
+    "focus_area": "focus_area",
+    "focus area": "focus_area",
+    "focus areas": "focus_area",
+}
+
+# get_excel_data() key holding the allowed values of each field
+REFERENCE_LISTS = {
+    "athlete": "athletes",
+    "duration": "durations",
+    "lesson_type": "lesson_types",
+    "focus_area": "focus_areas",
+}
+
+FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+
+class ImportFormatError(ValueError):
+    """Raised when an upload can't be read as the expected format at all."""
+
+
+def detect_format(requested=None, filename=None, content_type=None):
+    """Returns "csv" or "ndjson" from ?format=, the file extension or the content type."""
+    if requested:
+        if requested not in FORMATS:
+            raise ImportFormatError(f"Unknown format '{requested}', expected csv or ndjson")
+        return requested
+    name = (filename or "").lower()
+    if name.endswith((".ndjson", ".jsonl")):
+        return "ndjson"
+    if name.endswith(".csv"):
+        return "csv"
+    if content_type and "json" in content_type:
+        return "ndjson"
+    return "csv"
+
+
+def _field_map(names):
+    """Maps the upload's column names to FIELDS; raises if one is missing."""
+    mapping = {}
+    for name in names:
+        field = FIELD_ALIASES.get(str(name).strip().lower())
+        if field and field not in mapping.values():
+            mapping[name] = field
+    missing = [field for field in FIELDS if field not in mapping.values()]
+    if missing:
+        raise ImportFormatError(f"Missing column(s): {', '.join(missing)}")
+    return mapping
+
+
+def _pick(record, mapping):
+    return {field: record.get(name) for name, field in mapping.items()}
+
+
+def iter_records(stream, fmt):
+    """Yields (line number, record or None, error or None) from a binary upload stream."""
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    if fmt == "csv":
+        reader = csv.DictReader(text)
+        mapping = _field_map(reader.fieldnames or [])
+        for record in reader:
+            yield reader.line_num, _pick(record, mapping), None
+        return
+
+    for line_number, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield line_number, None, f"Invalid JSON: {e}"
+            continue
+        if not isinstance(record, dict):
+            yield line_number, None, "Expected a JSON object"
+            continue
+        try:
+            yield line_number, _pick(record, _field_map(record)), None
+        except ImportFormatError as e:
+            yield line_number, None, str(e)
+
+
+def _allowed_values(reference):
+    """Maps each field's stripped list values to the workbook's own spelling (lists carry stray spaces)."""
+    return {
+        field: {str(value).strip(): value for value in reference.get(key, [])}
+        for field, key in REFERENCE_LISTS.items()
+    }
+
+
+def validate(records, reference):
+    """Yields (line number, lesson or None, error or None), checking each record against reference.
+
+    reference is the get_excel_data() dict. Dates must be YYYY-MM-DD and every
+    other field one of the workbook's listed values, which the lesson takes
+    exactly as the workbook spells it.
+    """
+    allowed = _allowed_values(reference)
+    for line_number, record, error in records:
+        if error:
+            yield line_number, None, error
+            continue
+        lesson = {field: str(record[field]).strip() if record[field] is not None else "" for field in FIELDS}
+        try:
+            lesson["date"] = datetime.date.fromisoformat(lesson["date"]).isoformat()
+        except ValueError:
+            yield line_number, None, f"Invalid date '{lesson['date']}', expected YYYY-MM-DD"
+            continue
+        unknown = [f"{field} '{lesson[field]}'" for field in REFERENCE_LISTS if lesson[field] not in allowed[field]]
+        if unknown:
+            yield line_number, None, f"Not in the workbook's lists: {', '.join(unknown)}"
+            continue
+        for field in REFERENCE_LISTS:
+            lesson[field] = allowed[field][lesson[field]]
+        yield line_number, lesson, None
+
+
+def _cell(value):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    return value
+
+
+def export_rows(headers, rows, fmt, chunk_bytes=64 * 1024):
+    """Yields the rows as CSV (with a header line) or NDJSON text, in chunks of about chunk_bytes."""
+    buffer = io.StringIO()
+    if fmt == "ndjson":
+        def write(row):
+            buffer.write(json.dumps(dict(zip(headers, map(_cell, row)))) + "\n")
+    else:
+        writer = csv.writer(buffer)
+        writer.writerow(headers)
+
+        def write(row):
+            writer.writerow(["" if value is None else _cell(value) for value in row])
+
+    for row in rows:
+        write(row)
+        if buffer.tell() >= chunk_bytes:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
@@ -1,7 +1,73 @@
 # config.py
+import os
 
 CLIENT_ID = "your-client-id"
 CLIENT_SECRET = "your-client-secret"
 AUTHORITY = "https://login.microsoftonline.com/{your-tenant-id}"  # Replace with your tenant ID
 REDIRECT_URI = "http://localhost:5000/callback"
-SCOPE = ["User.Read", "Files.Read"]
+SCOPE = ["User.Read", "Files.ReadWrite"]
+
+# Local directory for cached OneDrive downloads and other per-user state
+CACHE_DIR = os.environ.get(
+    "LESSON_TRACKER_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache"),
+)
+
+# Committed lessons are journaled and written to the workbook (all pending ones
+# in one save) once this many are waiting, or the oldest has waited this many
+# seconds, if no commit has triggered a flush before that
+JOURNAL_FLUSH_BATCH_SIZE = int(os.environ.get("LESSON_TRACKER_FLUSH_BATCH_SIZE", "50"))
+JOURNAL_FLUSH_INTERVAL = float(os.environ.get("LESSON_TRACKER_FLUSH_INTERVAL", "30"))
+
+# Commits arriving within this many seconds of each other share one workbook
+# save; /commit-lessons waits up to COMMIT_WAIT_TIMEOUT for that save
+COMMIT_COALESCE_WINDOW = float(os.environ.get("LESSON_TRACKER_COMMIT_WINDOW", "0.2"))
+COMMIT_WAIT_TIMEOUT = float(os.environ.get("LESSON_TRACKER_COMMIT_WAIT_TIMEOUT", "15"))
+
+# Microsoft Graph client: connect/read timeouts in seconds and retries for
+# throttled (429/503) or failed calls
+GRAPH_CONNECT_TIMEOUT = float(os.environ.get("GRAPH_CONNECT_TIMEOUT", "5"))
+GRAPH_READ_TIMEOUT = float(os.environ.get("GRAPH_READ_TIMEOUT", "30"))
+GRAPH_MAX_RETRIES = int(os.environ.get("GRAPH_MAX_RETRIES", "3"))
+
+# How /lessons reads the workbook: "download" fetches the whole file and parses
+# it locally, "workbook" reads only cell values through the Graph workbook API
+# (falling back to "download" if that fails)
+LESSON_FETCH_MODE = os.environ.get("LESSON_FETCH_MODE", "download")
+
+# Name of an Excel table over 'lesson log' to commit lessons into with one
+# tables/rows/add call; when empty, lessons are PATCHed into the rows after the
+# sheet's used range instead
+LESSON_LOG_TABLE = os.environ.get("LESSON_TRACKER_LESSON_LOG_TABLE", "")
+
+# Background prefetch of the lesson log after sign-in: worker threads, and how
+# often (seconds) users active within the window get their workbook refreshed
+PREFETCH_WORKERS = int(os.environ.get("LESSON_TRACKER_PREFETCH_WORKERS", "2"))
+PREFETCH_INTERVAL = float(os.environ.get("LESSON_TRACKER_PREFETCH_INTERVAL", "300"))
+PREFETCH_ACTIVE_WINDOW = float(os.environ.get("LESSON_TRACKER_PREFETCH_ACTIVE_WINDOW", "1800"))
+
+# The local app watches its workbook for outside edits: how often to poll when
+# inotify isn't available, and how long a save must be quiet before it counts
+WATCH_POLL_INTERVAL = float(os.environ.get("LESSON_TRACKER_WATCH_POLL_INTERVAL", "2"))
+WATCH_DEBOUNCE = float(os.environ.get("LESSON_TRACKER_WATCH_DEBOUNCE", "1"))
+
+# JSON, HTML and CSV bodies at least this big are sent gzip/brotli compressed
+COMPRESS_MIN_BYTES = int(os.environ.get("LESSON_TRACKER_COMPRESS_MIN_BYTES", "1024"))
+
+# Per-worker memory budget (bytes) for users' parsed lesson logs in app.py, and
+# how long (seconds) an idle user's entry stays in memory. Entries pushed out
+# are kept on disk, within the second budget, for when the user comes back
+LESSON_CACHE_BYTES = int(os.environ.get("LESSON_TRACKER_LESSON_CACHE_BYTES", str(256 * 1024 * 1024)))
+LESSON_CACHE_TTL = float(os.environ.get("LESSON_TRACKER_LESSON_CACHE_TTL", "3600"))
+LESSON_CACHE_DISK_BYTES = int(os.environ.get("LESSON_TRACKER_LESSON_CACHE_DISK_BYTES", str(1024 * 1024 * 1024)))
+
+# Lessons per page on /lessons and /api/lessons, and the most a client may ask for
+LESSONS_PAGE_SIZE = int(os.environ.get("LESSON_TRACKER_PAGE_SIZE", "100"))
+LESSONS_PAGE_MAX = int(os.environ.get("LESSON_TRACKER_PAGE_MAX", "1000"))
+
+# Most lessons a single /lessons/import upload may contain
+IMPORT_MAX_ROWS = int(os.environ.get("LESSON_TRACKER_IMPORT_MAX_ROWS", "5000"))
+
+# Hourly rate used to price a lesson when the workbook has no calculated Rate
+# for it (matches the 40 in the 'lesson log' Rate formula)
+INVOICE_HOURLY_RATE = float(os.environ.get("INVOICE_HOURLY_RATE", "40"))
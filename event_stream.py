@@ -0,0 +1,60 @@
+"""Server-Sent Events fan-out to connected browsers.
+
+Every subscriber gets its own bounded queue. publish() numbers events with
+a version that increases by one per event, and each new stream starts with
+a "ready" event carrying the current version, so a browser that reconnects
+after missing events can tell and catch up once.
+"""
+import json
+import queue
+import threading
+
+HEARTBEAT_SECONDS = 15.0  # keeps proxies from closing idle streams
+QUEUE_SIZE = 100
+
+
+def _format(event, data, event_id=None):
+    lines = [f"event: {event}", f"data: {json.dumps(data)}"]
+    if event_id is not None:
+        lines.insert(0, f"id: {event_id}")
+    return "\n".join(lines) + "\n\n"
+
+
+class EventBroadcaster:
+    """Publishes named events to every open event stream."""
+
+    def __init__(self):
+        self.version = 0
+        self._lock = threading.Lock()
+        self._subscribers = set()
+
+    def publish(self, event, data=None):
+        """Sends event to every subscriber and returns its version."""
+        with self._lock:
+            self.version += 1
+            message = _format(event, {**(data or {}), "version": self.version}, self.version)
+            subscribers = list(self._subscribers)
+            version = self.version
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(message)
+            except queue.Full:
+                pass  # a stalled client resyncs from "ready" when it reconnects
+        return version
+
+    def stream(self):
+        """Yields the text/event-stream body for one subscriber until it disconnects."""
+        subscriber = queue.Queue(maxsize=QUEUE_SIZE)
+        with self._lock:
+            self._subscribers.add(subscriber)
+            ready = _format("ready", {"version": self.version})
+        try:
+            yield ready
+            while True:
+                try:
+                    yield subscriber.get(timeout=HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+        finally:
+            with self._lock:
+                self._subscribers.discard(subscriber)
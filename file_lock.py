@@ -0,0 +1,76 @@
+"""Exclusive OS-level file locks shared by every process on the machine.
+
+Used to serialise writers of the workbook across gunicorn workers, where a
+threading.Lock only covers one process. The lock is released when the file
+is closed, so a crashed holder never leaves it stuck.
+
+A blocking flock() stalls every greenlet of a gevent worker, not just the
+one waiting, so callers that run under gevent pass poll_interval: the lock is
+then tried without blocking and retried after time.sleep(), which gevent
+turns into a cooperative wait.
+"""
+import os
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class FileLock:
+    """Context manager holding an exclusive lock on path, waiting until it is free.
+
+    Without poll_interval the wait blocks in the OS; with it, the lock is
+    retried every poll_interval seconds.
+    """
+
+    def __init__(self, path, poll_interval=None):
+        self.path = path
+        self.poll_interval = poll_interval
+        self._fd = None
+
+    @staticmethod
+    def _try_lock(fd):
+        """Takes the lock without waiting; returns False if another holder has it."""
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        except (BlockingIOError, PermissionError):
+            return False
+        except OSError as e:
+            if fcntl is None:  # msvcrt reports a held lock as a plain OSError
+                return False
+            raise
+        return True
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if self.poll_interval is not None:
+                while not self._try_lock(fd):
+                    time.sleep(self.poll_interval)
+            elif fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            else:
+                msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+        except BaseException:
+            os.close(fd)
+            raise
+        self._fd = fd
+        return self
+
+    def __exit__(self, *exc):
+        fd, self._fd = self._fd, None
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(fd)
@@ -0,0 +1,134 @@
+"""Watches a file for changes made outside the app, e.g. by Excel or OneDrive sync.
+
+On Linux the file's directory is watched with inotify (through libc, so no
+extra dependency), which catches both in-place saves and the write-to-temp
+then rename that Excel does. Elsewhere, or when inotify isn't available, the
+file is polled with os.stat. Either way a change is only reported once the
+file has been quiet for debounce seconds, since a save arrives as a burst of
+events, and only if its (inode, size, mtime) actually differs.
+"""
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+import time
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+_EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+
+# With inotify, stat the file this often anyway: network and FUSE-backed sync
+# folders don't always deliver events
+INOTIFY_SAFETY_POLL = 30.0
+
+
+def _fingerprint(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+
+def _inotify_watch(directory):
+    """Returns an inotify fd watching directory, or None if inotify can't be used."""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        fd = libc.inotify_init1(os.O_CLOEXEC)
+    except (OSError, AttributeError):
+        return None
+    if fd < 0:
+        return None
+    if libc.inotify_add_watch(fd, os.fsencode(directory), WATCH_MASK) < 0:
+        os.close(fd)
+        return None
+    return fd
+
+
+def _names_in(buffer):
+    """Yields the file names carried by a buffer of inotify events."""
+    offset = 0
+    while offset + _EVENT_HEADER.size <= len(buffer):
+        _, _, _, length = _EVENT_HEADER.unpack_from(buffer, offset)
+        offset += _EVENT_HEADER.size
+        yield os.fsdecode(buffer[offset:offset + length].rstrip(b"\0"))
+        offset += length
+
+
+class FileWatcher:
+    """Background thread that calls on_change() when get_path()'s file changes.
+
+    on_change runs on the watcher thread and returns True once it has dealt
+    with the new version; on False the change is offered again on the next
+    poll (e.g. the file was caught halfway through a save).
+    """
+
+    def __init__(self, get_path, on_change, poll_interval=2.0, debounce=1.0):
+        self.get_path = get_path
+        self.on_change = on_change
+        self.poll_interval = poll_interval
+        self.debounce = debounce
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        """Starts watching once per process."""
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="workbook-watcher", daemon=True)
+            self._thread.start()
+
+    def _wait_for_event(self, fd, name, timeout):
+        """Blocks until name's directory reports an event for it, or timeout. Returns True on an event."""
+        readable, _, _ = select.select([fd], [], [], timeout)
+        if not readable:
+            return False
+        return name in _names_in(os.read(fd, 64 * 1024))
+
+    def _run(self):
+        path = self.get_path()
+        name = os.path.basename(path)
+        fd = _inotify_watch(os.path.dirname(os.path.abspath(path)))
+        print(f"Watching {path} for changes ({'inotify' if fd is not None else 'polling'})")
+
+        seen = _fingerprint(path)
+        retry = not self._notify_safely()  # reports the starting version so caches get warmed
+        while True:
+            if fd is not None:
+                if self._wait_for_event(fd, name, self.poll_interval if retry else INOTIFY_SAFETY_POLL):
+                    # Let the rest of the save land before looking at the file
+                    while self._wait_for_event(fd, name, self.debounce):
+                        pass
+            else:
+                time.sleep(self.poll_interval)
+
+            current = _fingerprint(path)
+            if current == seen and not retry:
+                continue
+            if fd is None:
+                time.sleep(self.debounce)
+                if _fingerprint(path) != current:
+                    continue  # still being written; look again next poll
+            retry = not self._notify_safely()
+            if not retry:
+                seen = current
+
+    def _notify_safely(self):
+        try:
+            return self.on_change()
+        except Exception as e:
+            print(f"Error handling workbook change: {e}")
+            return False
@@ -0,0 +1,209 @@
+"""Shared Microsoft Graph HTTP client.
+
+All Graph calls go through one pooled requests.Session so connections to
+graph.microsoft.com are kept alive between page views. Every call has connect
+and read timeouts, 429/503 (and other transient) responses are retried with
+exponential backoff that honours Retry-After, and per-call latency is
+recorded for get_stats(). Writes that must not be applied twice pass
+idempotent=False and are only retried when Graph can't have acted on them.
+batch() packs several calls into one JSON $batch round trip.
+"""
+import json
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib3.exceptions import NewConnectionError
+
+from config import GRAPH_CONNECT_TIMEOUT, GRAPH_MAX_RETRIES, GRAPH_READ_TIMEOUT
+
+GRAPH_BASE_URL = "https://graph.microsoft.com/v1.0"
+
+RETRY_STATUSES = {429, 502, 503, 504}
+BACKOFF_BASE = 0.5  # seconds, doubled on each attempt
+BACKOFF_MAX = 30.0  # never sleep longer than this, even if Retry-After asks to
+BATCH_LIMIT = 20  # most sub-requests Graph accepts in one $batch
+FAILED_DEPENDENCY = 424  # a sub-request skipped because one it dependsOn failed
+
+_session = requests.Session()
+_adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+_session.mount("https://", _adapter)
+
+_stats_lock = threading.Lock()
+_stats = {}
+
+
+def _url(path):
+    return path if path.startswith("https://") else f"{GRAPH_BASE_URL}{path}"
+
+
+def _retry_delay(response, attempt):
+    """Returns how long to wait before the next attempt."""
+    if response is not None:
+        retry_after = response.headers.get("Retry-After")
+        if retry_after:
+            try:
+                return min(float(retry_after), BACKOFF_MAX)
+            except ValueError:
+                pass  # HTTP-date form; Graph sends seconds, so fall back to backoff
+    delay = BACKOFF_BASE * (2 ** attempt)
+    return min(delay + random.uniform(0, delay / 2), BACKOFF_MAX)
+
+
+def _never_sent(error):
+    """Returns True if a request failed before it could reach Graph."""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0] if error.args else None, "reason", None)
+    return isinstance(reason, NewConnectionError)
+
+
+def _record(name, seconds, status, retries):
+    with _stats_lock:
+        stats = _stats.setdefault(
+            name, {"count": 0, "errors": 0, "retries": 0, "total_seconds": 0.0, "max_seconds": 0.0}
+        )
+        stats["count"] += 1
+        stats["retries"] += retries
+        stats["total_seconds"] += seconds
+        stats["max_seconds"] = max(stats["max_seconds"], seconds)
+        if status is None or status >= 400:
+            stats["errors"] += 1
+
+
+def request(method, path, token, name=None, headers=None, timeout=None, idempotent=True, **kwargs):
+    """Sends a Graph request with timeouts and retries and returns the response.
+
+    path is either a full URL or a path under GRAPH_BASE_URL. Raises
+    requests.RequestException if the call still fails after the last retry.
+    Responses with retryable statuses are returned as-is once retries run out.
+    With idempotent=False a request Graph may already have carried out (a
+    read timeout, a dropped connection, a 502/503/504) is not sent again;
+    only connection failures and 429s with Retry-After are retried.
+    """
+    name = name or f"{method} {path}"
+    url = _url(path)
+    headers = {**(headers or {}), "Authorization": f"Bearer {token}"}
+    timeout = timeout or (GRAPH_CONNECT_TIMEOUT, GRAPH_READ_TIMEOUT)
+
+    start = time.monotonic()
+    attempt = 0
+    while True:
+        response = None
+        try:
+            response = _session.request(method, url, headers=headers, timeout=timeout, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if attempt >= GRAPH_MAX_RETRIES or not (idempotent or _never_sent(e)):
+                _record(name, time.monotonic() - start, None, attempt)
+                raise
+        else:
+            if idempotent:
+                retry = response.status_code in RETRY_STATUSES
+            else:
+                retry = response.status_code == 429 and "Retry-After" in response.headers
+            if not retry or attempt >= GRAPH_MAX_RETRIES:
+                _record(name, time.monotonic() - start, response.status_code, attempt)
+                return response
+            response.close()
+
+        time.sleep(_retry_delay(response, attempt))
+        attempt += 1
+
+
+def get(path, token, **kwargs):
+    return request("GET", path, token, **kwargs)
+
+
+class BatchResponse:
+    """One sub-response of a $batch call, with the parts of requests.Response callers use."""
+
+    def __init__(self, item):
+        self.status_code = item.get("status", 500)
+        self.headers = CaseInsensitiveDict(item.get("headers") or {})
+        self._body = item.get("body")
+
+    def json(self):
+        if isinstance(self._body, str):
+            return json.loads(self._body)  # raises ValueError like requests does
+        return self._body
+
+    @property
+    def text(self):
+        return self._body if isinstance(self._body, str) else json.dumps(self._body)
+
+
+def batch(items, token, name="batch"):
+    """Sends sub-requests as one JSON $batch call and returns {id: BatchResponse}.
+
+    items use Graph's $batch format: dicts with id, method, url (a path under
+    GRAPH_BASE_URL) and optionally headers, body and dependsOn. Sub-requests
+    that were throttled, or skipped only because one they depend on was
+    throttled, are sent again in a smaller batch, up to GRAPH_MAX_RETRIES
+    times; whatever they returned last is what the caller gets. Raises
+    requests.RequestException if the $batch call itself fails.
+    """
+    if len(items) > BATCH_LIMIT:
+        raise ValueError(f"A $batch holds at most {BATCH_LIMIT} requests, got {len(items)}")
+
+    responses = {}
+    pending = list(items)
+    attempt = 0
+    while pending:
+        response = request("POST", "/$batch", token, name=name, json={"requests": pending})
+        if response.status_code >= 400:
+            raise requests.HTTPError(
+                f"$batch failed ({response.status_code}): {response.text}", response=response
+            )
+
+        sent_depends_on = {item["id"]: item.get("dependsOn", []) for item in pending}
+        retry_ids = set()
+        skipped = []
+        delay = 0.0
+        for item in response.json().get("responses", []):
+            sub = BatchResponse(item)
+            responses[item["id"]] = sub
+            if attempt >= GRAPH_MAX_RETRIES:
+                continue
+            if sub.status_code in RETRY_STATUSES:
+                retry_ids.add(item["id"])
+                delay = max(delay, _retry_delay(sub, attempt))
+            elif sub.status_code == FAILED_DEPENDENCY:
+                skipped.append(item["id"])
+
+        # A skipped sub-request is only worth sending again if everything it
+        # waited on is being retried; if one failed for good, its 424 stands
+        added = True
+        while added:
+            added = False
+            for item_id in skipped:
+                depends_on = sent_depends_on.get(item_id)
+                if item_id not in retry_ids and depends_on and all(dep in retry_ids for dep in depends_on):
+                    retry_ids.add(item_id)
+                    added = True
+
+        # Keep ordering only between sub-requests that are being sent again
+        pending = []
+        for item in items:
+            if item["id"] not in retry_ids:
+                continue
+            item = dict(item)
+            depends_on = [dep for dep in item.pop("dependsOn", []) if dep in retry_ids]
+            if depends_on:
+                item["dependsOn"] = depends_on
+            pending.append(item)
+        if pending and delay:
+            time.sleep(delay)
+        attempt += 1
+    return responses
+
+
+def get_stats():
+    """Returns a copy of the per-call latency counters, with the mean filled in."""
+    with _stats_lock:
+        snapshot = {name: dict(stats) for name, stats in _stats.items()}
+    for stats in snapshot.values():
+        stats["mean_seconds"] = stats["total_seconds"] / stats["count"] if stats["count"] else 0.0
+    return snapshot
@@ -0,0 +1,421 @@
+"""Reads and appends to the lesson log through the Graph workbook API instead of moving the file.
+
+Only cell values cross the wire: the used range of 'lesson log' is fetched in
+pages of PAGE_ROWS rows with range(address=...) calls, inside a workbook
+session that is reused across requests for as long as Graph keeps it alive.
+Commits go the other way as a few rows of values, written in a persistent
+session, so their cost doesn't grow with the workbook. fetch_tracker() reads
+the item tag, the first page of 'lesson log' and the dropdown lists in a
+single $batch round trip.
+"""
+import contextlib
+import hashlib
+import os
+import re
+import threading
+import time
+import weakref
+
+import graph_client
+import lesson_log
+from config import CACHE_DIR
+from file_lock import FileLock
+
+WORKBOOK_PATH = "/me/drive/root:/LessonTracker.xlsx:/workbook"
+ITEM_PATH = "/me/drive/root:/LessonTracker.xlsx"
+PAGE_ROWS = 5000
+REFERENCE_SHEETS = ("skater info", "list info")
+LIST_COLUMNS = {"durations": "Durations", "lesson_types": "Lesson Types", "focus_areas": "Focus Areas"}
+
+# Graph drops idle sessions after about five minutes; renew a little earlier
+SESSION_IDLE_SECONDS = 240
+
+_sessions_lock = threading.Lock()
+_sessions = {}  # (user_id, persist) -> (session_id, last_used)
+
+_CELL_RE = re.compile(r"^\$?([A-Z]+)\$?(\d+)$")
+
+# One lock per user for range appends within this process, held only while in use
+_append_locks_lock = threading.Lock()
+_append_locks = weakref.WeakValueDictionary()  # user_id -> threading.Lock
+
+# How often a waiting append retries the cross-process lock
+APPEND_LOCK_POLL_SECONDS = 0.05
+
+
+class WorkbookError(Exception):
+    """Raised when a Graph workbook API call fails."""
+
+
+def _error_code(response):
+    try:
+        return response.json().get("error", {}).get("code", "")
+    except ValueError:
+        return ""
+
+
+def _raise_for_status(response, what):
+    if response.status_code >= 400:
+        raise WorkbookError(f"{what} failed ({response.status_code}): {response.text}")
+
+
+def _create_session(token, persist):
+    response = graph_client.request(
+        "POST", f"{WORKBOOK_PATH}/createSession", token,
+        name="workbook_create_session", json={"persistChanges": persist},
+    )
+    _raise_for_status(response, "Creating workbook session")
+    return response.json()["id"]
+
+
+def _get_session_id(user_id, token, persist):
+    key = (user_id, persist)
+    now = time.monotonic()
+    with _sessions_lock:
+        cached = _sessions.get(key)
+        if cached and now - cached[1] < SESSION_IDLE_SECONDS:
+            _sessions[key] = (cached[0], now)
+            return cached[0]
+    session_id = _create_session(token, persist)
+    with _sessions_lock:
+        _sessions[key] = (session_id, now)
+    return session_id
+
+
+def _drop_session(user_id, persist):
+    with _sessions_lock:
+        _sessions.pop((user_id, persist), None)
+
+
+def workbook_request(user_id, token, method, path, name, persist=False, **kwargs):
+    """Sends a request under the user's workbook session, renewing it once if Graph dropped it."""
+    for attempt in range(2):
+        session_id = _get_session_id(user_id, token, persist)
+        response = graph_client.request(
+            method, f"{WORKBOOK_PATH}{path}", token, name=name,
+            headers={"workbook-session-id": session_id}, **kwargs,
+        )
+        if response.status_code in (400, 404) and "session" in _error_code(response).lower() and attempt == 0:
+            _drop_session(user_id, persist)
+            continue
+        return response
+
+
+def workbook_batch(user_id, token, items, extra=(), persist=False, name="workbook_batch"):
+    """Sends workbook GETs as one $batch under the user's session and returns {id: response}.
+
+    items are (id, path under WORKBOOK_PATH) pairs. Each dependsOn the one
+    before it, since Graph runs calls sharing a session one at a time anyway.
+    extra holds ready-made sub-requests (e.g. driveItem metadata) that run
+    alongside them. Renews the session once if Graph dropped it.
+    """
+    for attempt in range(2):
+        session_id = _get_session_id(user_id, token, persist)
+        batch_items = list(extra)
+        previous = None
+        for item_id, path in items:
+            item = {
+                "id": item_id, "method": "GET", "url": f"{WORKBOOK_PATH}{path}",
+                "headers": {"workbook-session-id": session_id},
+            }
+            if previous:
+                item["dependsOn"] = [previous]
+            batch_items.append(item)
+            previous = item_id
+        responses = graph_client.batch(batch_items, token, name=name)
+        session_lost = any(
+            response.status_code in (400, 404) and "session" in _error_code(response).lower()
+            for response in responses.values()
+        )
+        if session_lost and attempt == 0:
+            _drop_session(user_id, persist)
+            continue
+        return responses
+
+
+def get_item_tag(token):
+    """Returns the driveItem's eTag (or cTag), used to validate cached rows."""
+    response = graph_client.get(
+        f"{ITEM_PATH}?$select=eTag,cTag", token, name="workbook_metadata"
+    )
+    _raise_for_status(response, "Reading workbook metadata")
+    item = response.json()
+    return item.get("eTag") or item.get("cTag")
+
+
+def _column_number(letters):
+    number = 0
+    for letter in letters:
+        number = number * 26 + ord(letter) - ord("A") + 1
+    return number
+
+
+def _column_letters(number):
+    letters = ""
+    while number:
+        number, remainder = divmod(number - 1, 26)
+        letters = chr(ord("A") + remainder) + letters
+    return letters
+
+
+def parse_address(address):
+    """Parses "'lesson log'!A1:H1998" into (first_col, first_row, last_col, last_row)."""
+    cells = address.rsplit("!", 1)[-1].split(":")
+    first = _CELL_RE.match(cells[0])
+    last = _CELL_RE.match(cells[-1])
+    if not first or not last:
+        raise WorkbookError(f"Unexpected range address: {address}")
+    return (
+        _column_number(first.group(1)), int(first.group(2)),
+        _column_number(last.group(1)), int(last.group(2)),
+    )
+
+
+def _sheet_path(sheet_name):
+    return f"/worksheets('{sheet_name}')"
+
+
+def fetch_used_address(user_id, token, sheet_name=lesson_log.LESSON_LOG_SHEET, persist=False):
+    """Returns the parsed used-range address of a worksheet."""
+    response = workbook_request(
+        user_id, token, "GET",
+        f"{_sheet_path(sheet_name)}/usedRange(valuesOnly=true)?$select=address",
+        name="workbook_used_range", persist=persist,
+    )
+    _raise_for_status(response, f"Reading used range of '{sheet_name}'")
+    return parse_address(response.json()["address"])
+
+
+def fetch_range_values(user_id, token, address, sheet_name=lesson_log.LESSON_LOG_SHEET, persist=False):
+    """Returns the values of one range as a list of rows."""
+    response = workbook_request(
+        user_id, token, "GET",
+        f"{_sheet_path(sheet_name)}/range(address='{address}')?$select=values",
+        name="workbook_range", persist=persist,
+    )
+    _raise_for_status(response, f"Reading range {address} of '{sheet_name}'")
+    return response.json()["values"]
+
+
+def _column_values(values, header):
+    """Returns the non-empty cells under header in a block of values whose first row holds headers."""
+    if not values or header not in values[0]:
+        return []
+    index = values[0].index(header)
+    return [row[index] for row in values[1:] if row[index] not in (None, "")]
+
+
+def _reference_lists(sheet_names, sheet_values):
+    """Builds get_excel_data()'s dict of dropdown lists from 'skater info' and 'list info' values."""
+    skaters = sheet_values.get("skater info") or []
+    athletes = []
+    if skaters:
+        # Same column choice as get_excel_data: the first that looks like a name
+        athlete_col = next(
+            (col for col in skaters[0] if any(name in str(col).lower() for name in ["name", "athlete", "student"])),
+            skaters[0][0],
+        )
+        athletes = _column_values(skaters, athlete_col)
+    lists = sheet_values.get("list info") or []
+    data = {"athletes": athletes}
+    for key, header in LIST_COLUMNS.items():
+        data[key] = _column_values(lists, header)
+    data["sheet_names"] = sheet_names
+    return data
+
+
+def fetch_tracker(user_id, token, lessons=True, reference_lists=True):
+    """Reads what a tracker page needs in one $batch round trip.
+
+    Returns (etag, (headers, row iterator) or None, reference lists or None).
+    The batch holds the driveItem tag, the used-range address of 'lesson log'
+    with the values of its first PAGE_ROWS rows, and the used values of the
+    sheets behind the dropdowns. Rows past the first page are fetched as the
+    iterator is consumed, so errors on the first page surface before a
+    response starts streaming.
+    """
+    sheet = _sheet_path(lesson_log.LESSON_LOG_SHEET)
+    items = []
+    if lessons:
+        items.append(("lesson_log_used", f"{sheet}/usedRange(valuesOnly=true)?$select=address"))
+        items.append((
+            "lesson_log_first_page",
+            f"{sheet}/range(address='A1:XFD{PAGE_ROWS}')/usedRange(valuesOnly=true)?$select=address,values",
+        ))
+    if reference_lists:
+        items.append(("sheet_names", "/worksheets?$select=name"))
+        for number, sheet_name in enumerate(REFERENCE_SHEETS):
+            items.append((f"sheet_{number}", f"{_sheet_path(sheet_name)}/usedRange(valuesOnly=true)?$select=values"))
+    metadata = {"id": "item", "method": "GET", "url": f"{ITEM_PATH}?$select=eTag,cTag"}
+    responses = workbook_batch(user_id, token, items, extra=[metadata])
+
+    _raise_for_status(responses["item"], "Reading workbook metadata")
+    item = responses["item"].json()
+    etag = item.get("eTag") or item.get("cTag")
+
+    lesson_rows = None
+    if lessons:
+        lesson_rows = _batched_lesson_log(user_id, token, responses)
+
+    lists = None
+    if reference_lists:
+        _raise_for_status(responses["sheet_names"], "Listing worksheets")
+        sheet_names = [sheet["name"] for sheet in responses["sheet_names"].json()["value"]]
+        sheet_values = {}
+        for number, sheet_name in enumerate(REFERENCE_SHEETS):
+            response = responses[f"sheet_{number}"]
+            if sheet_name not in sheet_names:
+                print(f"Warning: '{sheet_name}' sheet not found")
+                continue
+            _raise_for_status(response, f"Reading '{sheet_name}'")
+            sheet_values[sheet_name] = response.json()["values"]
+        lists = _reference_lists(sheet_names, sheet_values)
+    return etag, lesson_rows, lists
+
+
+def _batched_lesson_log(user_id, token, responses):
+    """Returns (headers, row iterator) from fetch_tracker's lesson log sub-responses."""
+    _raise_for_status(responses["lesson_log_used"], "Reading used range of 'lesson log'")
+    _, _, last_col, last_row = parse_address(responses["lesson_log_used"].json()["address"])
+
+    page_response = responses["lesson_log_first_page"]
+    if page_response.status_code == 404 and _error_code(page_response) == "ItemNotFound":
+        return [], lesson_log.typed_rows([], ())  # nothing in the first PAGE_ROWS rows: an empty sheet
+    _raise_for_status(page_response, "Reading the first page of 'lesson log'")
+    first_page = page_response.json()
+    first_col = parse_address(first_page["address"])[0]
+    first_letters, last_letters = _column_letters(first_col), _column_letters(max(first_col, last_col))
+    headers = lesson_log.headers_from_row(first_page["values"][0] if first_page["values"] else ())
+
+    def raw_rows():
+        yield from first_page["values"][1:]
+        for start in range(PAGE_ROWS + 1, last_row + 1, PAGE_ROWS):
+            end = min(start + PAGE_ROWS - 1, last_row)
+            yield from fetch_range_values(user_id, token, f"{first_letters}{start}:{last_letters}{end}")
+
+    return headers, lesson_log.typed_rows(headers, raw_rows())
+
+
+@contextlib.contextmanager
+def _append_lock(user_id):
+    """Serialises one user's range appends across threads, greenlets and workers.
+
+    Waiters in this process queue on a threading.Lock (cooperative under
+    gevent's patching), so at most one of them polls the file lock that
+    covers the other workers.
+    """
+    with _append_locks_lock:
+        lock = _append_locks.get(user_id)
+        if lock is None:
+            lock = _append_locks[user_id] = threading.Lock()
+    digest = hashlib.sha256(str(user_id).encode("utf-8")).hexdigest()
+    path = os.path.join(CACHE_DIR, "graph-append", f"{digest}.lock")
+    with lock, FileLock(path, poll_interval=APPEND_LOCK_POLL_SECONDS):
+        yield
+
+
+def _lesson_rows(headers, lessons):
+    try:
+        return [lesson_log.lesson_row(headers, lesson) for lesson in lessons]
+    except ValueError as e:
+        raise WorkbookError(f"'lesson log' is missing a column: {e}. Headers found: {headers}")
+
+
+def _append_to_table(user_id, token, table, lessons):
+    """Adds the lessons as rows of an Excel table in one tables/rows/add call.
+
+    The header row is read first on every commit: a moved column still
+    accepts the rows, just in the wrong places.
+    """
+    table_path = f"/tables('{table}')"
+    response = workbook_request(
+        user_id, token, "GET", f"{table_path}/headerRowRange?$select=values",
+        name="workbook_table_headers", persist=True,
+    )
+    _raise_for_status(response, f"Reading headers of table '{table}'")
+    headers = lesson_log.headers_from_row(response.json()["values"][0])
+
+    # Rows span every table column; calculated columns (like Rate) fill themselves in
+    rows = _lesson_rows(headers, lessons)
+    # Sending rows/add again after Graph may have run it would add the rows twice
+    response = workbook_request(
+        user_id, token, "POST", f"{table_path}/rows/add",
+        name="workbook_table_add", persist=True, idempotent=False,
+        json={"index": None, "values": rows},
+    )
+    _raise_for_status(response, f"Adding rows to table '{table}'")
+
+
+def _first_empty_date_row(user_id, token, headers, used, sheet_name):
+    """Returns the sheet row of the first empty Date cell below the headers.
+
+    used is the sheet's parsed used-range address. Like the local tracker's
+    scan, only the Date column counts: the used range also covers rows where
+    just formula columns (like Rate) are filled in, and those rows are free.
+    """
+    first_col, first_row, _, last_row = used
+    if last_row <= first_row:
+        return first_row + 1
+    date_col = _column_letters(first_col + headers.index(lesson_log.DATE_HEADER))
+    address = f"{date_col}{first_row + 1}:{date_col}{last_row}"
+    values = fetch_range_values(user_id, token, address, sheet_name, persist=True)
+    for offset, row in enumerate(values):
+        if row[0] in (None, ""):
+            return first_row + 1 + offset
+    return last_row + 1
+
+
+def _append_to_range(user_id, token, lessons, sheet_name):
+    """PATCHes the lessons into the rows starting at the first empty Date cell.
+
+    Reading the layout, finding the next row and writing it are separate
+    calls, so they run under a per-user lock shared by every worker on the
+    machine. The header row is re-read each time, in the same round trip as
+    the used range, so a column inserted or moved since the last commit
+    can't shift the lessons into the wrong cells.
+    """
+    sheet = _sheet_path(sheet_name)
+    with _append_lock(user_id):
+        # Read in the persistent session, so it sees our own earlier appends
+        layout = workbook_batch(
+            user_id, token,
+            [
+                ("used", f"{sheet}/usedRange(valuesOnly=true)?$select=address"),
+                ("header_row", f"{sheet}/usedRange(valuesOnly=true)/row(row=0)?$select=values"),
+            ],
+            persist=True, name="workbook_append_layout",
+        )
+        _raise_for_status(layout["used"], f"Reading used range of '{sheet_name}'")
+        _raise_for_status(layout["header_row"], f"Reading headers of '{sheet_name}'")
+        used = parse_address(layout["used"].json()["address"])
+        headers = lesson_log.headers_from_row(layout["header_row"].json()["values"][0])
+        rows = _lesson_rows(headers, lessons)
+
+        first_col = used[0]
+        start = _first_empty_date_row(user_id, token, headers, used, sheet_name)
+        address = (
+            f"{_column_letters(first_col)}{start}:"
+            f"{_column_letters(first_col + len(headers) - 1)}{start + len(rows) - 1}"
+        )
+        # null cells are left as they are, so formulas in other columns survive
+        response = workbook_request(
+            user_id, token, "PATCH", f"{sheet}/range(address='{address}')",
+            name="workbook_range_write", persist=True, json={"values": rows},
+        )
+    _raise_for_status(response, f"Writing range {address} of '{sheet_name}'")
+
+
+def append_lessons(user_id, token, lessons, table=None, sheet_name=lesson_log.LESSON_LOG_SHEET):
+    """Appends lesson dicts to the lesson log in OneDrive without transferring the workbook.
+
+    With a table name the rows go through the table's rows/add; otherwise
+    they are written after the used range of sheet_name. Changes are made in
+    a persistent session, so Graph saves them to the file. Raises
+    WorkbookError (or requests.RequestException) if the write fails.
+    """
+    if not lessons:
+        return
+    if table:
+        _append_to_table(user_id, token, table, lessons)
+    else:
+        _append_to_range(user_id, token, lessons, sheet_name)
@@ -0,0 +1,155 @@
+"""Conditional (ETag/304) and compressed responses.
+
+make_etag() hashes whatever a response is built from (a workbook fingerprint,
+a pending-store version...) into a strong ETag, so a route can compare it
+with If-None-Match and answer 304 before reading anything. init_app()
+compresses JSON, HTML and CSV bodies with brotli when the client accepts it
+and the optional brotli package is installed, gzip otherwise. Streamed bodies
+are compressed chunk by chunk and keep streaming.
+"""
+import hashlib
+import zlib
+
+from flask import Response, request
+
+from config import COMPRESS_MIN_BYTES
+
+try:
+    import brotli
+except ImportError:  # optional; gzip is used instead
+    brotli = None
+
+COMPRESSIBLE_TYPES = {
+    "application/json",
+    "application/x-ndjson",
+    "text/csv",
+    "text/html",
+    "text/plain",
+}
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5  # higher levels cost more CPU than they save on dynamic bodies
+
+# A streamed body is flushed to the client after about this much input, so
+# rows keep arriving while the rest is still being produced
+STREAM_FLUSH_BYTES = 16 * 1024
+
+
+def make_etag(*parts):
+    """Returns a strong ETag value (unquoted) identifying parts."""
+    return hashlib.sha256(repr(parts).encode("utf-8")).hexdigest()[:32]
+
+
+def is_fresh(etag):
+    """Returns True if the request's If-None-Match already names etag, in any encoding."""
+    if_none_match = request.if_none_match
+    if if_none_match.star_tag:
+        return True
+    return any(tag == etag or tag in (f"{etag}-gzip", f"{etag}-br") for tag in if_none_match)
+
+
+def set_etag(response, etag):
+    """Marks response with etag; clients keep it but revalidate before every reuse."""
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+
+def not_modified(etag):
+    """Returns an empty 304 for etag."""
+    response = set_etag(Response(status=304), etag)
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+def _choose_encoding():
+    accepted = request.accept_encodings
+    gzip_quality = accepted["gzip"]
+    if brotli is not None and accepted["br"] and accepted["br"] >= gzip_quality:
+        return "br"
+    if gzip_quality:
+        return "gzip"
+    return None
+
+
+class _Compressor:
+    """Incremental gzip or brotli compressor with the same three calls for both."""
+
+    def __init__(self, encoding):
+        self.encoding = encoding
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self._zlib = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data):
+        if self.encoding == "br":
+            return self._brotli.process(data)
+        return self._zlib.compress(data)
+
+    def flush(self):
+        if self.encoding == "br":
+            return self._brotli.flush()
+        return self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        if self.encoding == "br":
+            return self._brotli.finish()
+        return self._zlib.flush()
+
+
+def _compress_stream(chunks, encoding):
+    compressor = _Compressor(encoding)
+    pending = 0
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode("utf-8")
+            data = compressor.compress(chunk)
+            pending += len(chunk)
+            if pending >= STREAM_FLUSH_BYTES:
+                data += compressor.flush()
+                pending = 0
+            if data:
+                yield data
+        yield compressor.finish()
+    finally:
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            close()
+
+
+def _compress_response(response):
+    if (
+        response.status_code < 200
+        or response.status_code in (204, 206, 304)
+        or response.direct_passthrough
+        or "Content-Encoding" in response.headers
+        or response.mimetype not in COMPRESSIBLE_TYPES
+    ):
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = _choose_encoding()
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = _compress_stream(response.response, encoding)
+        response.headers.pop("Content-Length", None)
+    else:
+        data = response.get_data()
+        if len(data) < COMPRESS_MIN_BYTES:
+            return response
+        compressor = _Compressor(encoding)
+        response.set_data(compressor.compress(data) + compressor.finish())
+    response.headers["Content-Encoding"] = encoding
+
+    # The compressed bytes are a different representation, so they get their own tag
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(f"{etag}-{encoding}", weak)
+    return response
+
+
+def init_app(app):
+    """Compresses app's compressible responses for clients that accept it."""
+    app.after_request(_compress_response)
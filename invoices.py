@@ -0,0 +1,193 @@
+"""Invoice totals computed from the lesson log with vectorized pandas operations.
+
+The three sheets involved are loaded once per workbook fingerprint into data
+frames from the workbook's columnar snapshot. Each lesson is then priced with
+column arithmetic only: its duration is joined to the per-duration rate table
+in 'list info', the result is split by the group size named in its lesson
+type, and lessons are grouped by athlete and month. Results are memoized per (fingerprint, period).
+"""
+import threading
+
+import pandas as pd
+
+import workbook_snapshot
+from config import INVOICE_HOURLY_RATE
+
+DATE_COL = "Date"
+ATHLETE_COL = "Athlete's Name"
+DURATION_COL = "Durations"
+LESSON_TYPE_COL = "Lesson Types"
+FOCUS_AREA_COL = "Focus Areas"
+RATE_COL = "Rate"
+
+LINE_COLUMNS = ["athlete", "date", "duration", "lesson_type", "focus_area", "hours", "amount"]
+
+_lock = threading.Lock()
+_frames = {"fingerprint": None, "frames": None}
+_results = {}  # (fingerprint, period) -> payload, only for the current fingerprint
+
+
+def load_frames(path, fingerprint):
+    """Returns the lesson log, skater info and list info frames for this workbook version.
+
+    Frames come from the workbook's columnar snapshot, so the xlsm is parsed
+    at most once per fingerprint, and only the columns invoicing uses are loaded.
+    """
+    with _lock:
+        if _frames["fingerprint"] == fingerprint:
+            return _frames["frames"]
+        snapshot = workbook_snapshot.get_snapshot(path, fingerprint)
+        log_columns = [DATE_COL, ATHLETE_COL, DURATION_COL, LESSON_TYPE_COL, FOCUS_AREA_COL, RATE_COL]
+        frames = {
+            "lesson log": snapshot.frame("lesson log", columns=log_columns),
+            "skater info": snapshot.frame("skater info") if snapshot.has_sheet("skater info") else None,
+            "list info": snapshot.frame("list info") if snapshot.has_sheet("list info") else None,
+        }
+        _frames["fingerprint"] = fingerprint
+        _frames["frames"] = frames
+        _results.clear()
+        return frames
+
+
+def _duration_rates(list_df):
+    """Returns a frame of Durations -> minutes, private-lesson rate from 'list info'.
+
+    The rate table sits right of the Durations column: minutes, then the rate.
+    Returns None when that layout isn't there.
+    """
+    if list_df is None or DURATION_COL not in list_df.columns:
+        return None
+    position = list_df.columns.get_loc(DURATION_COL)
+    if position + 2 >= len(list_df.columns):
+        return None
+    table = pd.DataFrame({
+        DURATION_COL: list_df[DURATION_COL],
+        "table_minutes": pd.to_numeric(list_df.iloc[:, position + 1], errors="coerce"),
+        "table_rate": pd.to_numeric(list_df.iloc[:, position + 2], errors="coerce"),
+    }).dropna(subset=[DURATION_COL])
+    return table.drop_duplicates(subset=[DURATION_COL])
+
+
+def _group_sizes(lesson_types):
+    """Vectorized group size per lesson type: Private 1, Semi-Private 2, 'Group of N' N."""
+    lowered = lesson_types.astype("string").str.strip().str.lower()
+    sizes = pd.to_numeric(lowered.str.extract(r"(\d+)", expand=False), errors="coerce")
+    sizes = sizes.mask(lowered.str.startswith("semi"), 2)
+    sizes = sizes.mask(lowered.str.startswith("private"), 1)
+    return sizes.fillna(1)
+
+
+def price_lessons(frames):
+    """Returns one row per lesson with athlete, month, hours and amount columns."""
+    log = frames["lesson log"]
+    log = log.dropna(subset=[DATE_COL, ATHLETE_COL]).copy()
+
+    log["date"] = pd.to_datetime(log[DATE_COL], errors="coerce")
+    log = log.dropna(subset=["date"])
+    log["month"] = log["date"].dt.strftime("%Y-%m")
+
+    # Minutes from the rate table when the duration is listed there, else from the text ("45min")
+    rates = _duration_rates(frames["list info"])
+    if rates is not None:
+        log = log.merge(rates, on=DURATION_COL, how="left")
+    else:
+        log["table_minutes"] = float("nan")
+        log["table_rate"] = float("nan")
+    text_minutes = pd.to_numeric(
+        log[DURATION_COL].astype("string").str.extract(r"(\d+)", expand=False), errors="coerce"
+    )
+    log["minutes"] = log["table_minutes"].fillna(text_minutes).fillna(0)
+    log["hours"] = log["minutes"] / 60
+
+    # Same pricing as the sheet's Rate formula: the private rate split across the group.
+    # A Rate value Excel already calculated takes precedence.
+    private_rate = log["table_rate"].fillna(log["hours"] * INVOICE_HOURLY_RATE)
+    computed = private_rate / _group_sizes(log[LESSON_TYPE_COL])
+    if RATE_COL in log.columns:
+        log["amount"] = pd.to_numeric(log[RATE_COL], errors="coerce").fillna(computed)
+    else:
+        log["amount"] = computed
+
+    return log.rename(columns={
+        ATHLETE_COL: "athlete",
+        DURATION_COL: "duration",
+        LESSON_TYPE_COL: "lesson_type",
+        FOCUS_AREA_COL: "focus_area",
+    })
+
+
+def _athlete_details(skater_df):
+    """Returns the skater info rows to join onto invoices, one per athlete."""
+    if skater_df is None or ATHLETE_COL not in skater_df.columns:
+        return None
+    details = skater_df.dropna(subset=[ATHLETE_COL]).drop_duplicates(subset=[ATHLETE_COL])
+    details = details.rename(columns={
+        ATHLETE_COL: "athlete",
+        "Parent's Name": "parent_name",
+        "Parent's Email": "parent_email",
+        "Level": "level",
+    })
+    keep = [col for col in ["athlete", "parent_name", "parent_email", "level"] if col in details.columns]
+    return details[keep]
+
+
+def _records(df):
+    # NaN is not valid JSON, so blank it out before handing records to jsonify
+    return df.astype(object).where(df.notna(), None).to_dict("records")
+
+
+def build_invoices(path, fingerprint, period=None):
+    """Returns the invoice payload for a month ("YYYY-MM"), or for every month if period is None.
+
+    The payload has per-athlete/per-month summaries, flat CSV-ready line items
+    and grand totals. It is memoized per (fingerprint, period).
+    """
+    key = (fingerprint, period)
+    with _lock:
+        if key in _results:
+            return _results[key]
+
+    frames = load_frames(path, fingerprint)
+    lessons = price_lessons(frames)
+    if period is not None:
+        lessons = lessons[lessons["month"] == period]
+
+    summary = (
+        lessons.groupby(["athlete", "month"], sort=True)
+        .agg(lessons=("amount", "size"), hours=("hours", "sum"), amount=("amount", "sum"))
+        .reset_index()
+    )
+    details = _athlete_details(frames["skater info"])
+    if details is not None:
+        summary = summary.merge(details, on="athlete", how="left")
+    summary["hours"] = summary["hours"].round(2)
+    summary["amount"] = summary["amount"].round(2)
+
+    lines = lessons.sort_values(["athlete", "date"], kind="stable")
+    lines = lines.assign(
+        date=lines["date"].dt.strftime("%Y-%m-%d"),
+        hours=lines["hours"].round(2),
+        amount=lines["amount"].round(2),
+    )[LINE_COLUMNS]
+
+    payload = {
+        "period": period,
+        "hourly_rate": INVOICE_HOURLY_RATE,
+        "invoices": _records(summary),
+        "line_columns": LINE_COLUMNS,
+        "lines": _records(lines),
+        "totals": {
+            "lessons": int(len(lessons)),
+            "hours": round(float(lessons["hours"].sum()), 2),
+            "amount": round(float(lessons["amount"].sum()), 2),
+        },
+    }
+    with _lock:
+        if _frames["fingerprint"] == fingerprint:
+            _results[key] = payload
+    return payload
+
+
+def lines_to_csv(payload):
+    """Renders the payload's line items as CSV text."""
+    return pd.DataFrame(payload["lines"], columns=payload["line_columns"]).to_csv(index=False)
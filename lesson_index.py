@@ -0,0 +1,184 @@
+"""In-memory secondary indexes over parsed 'lesson log' rows.
+
+LessonIndex keeps a date-sorted index over all rows plus hash indexes on
+"Athlete's Name" and "Lesson Types", each of which is itself date-sorted, so a
+filtered query costs a dictionary lookup and two bisections plus the rows it
+returns, instead of a scan of the whole sheet. page() walks the same indexes
+from a (date, position) key, so a page of results costs the same wherever it
+falls in the sheet. Such keys stay valid for as long as the rows they were
+taken from are still the first rows of the sheet; prefix_digest() lets any
+worker check that, whatever version its own index was built at.
+"""
+import bisect
+import datetime
+import hashlib
+import itertools
+
+import lesson_log
+
+ATHLETE_HEADER = "Athlete's Name"
+LESSON_TYPE_HEADER = "Lesson Types"
+
+# Rows whose Date cell isn't a real date sort before every real date and are
+# left out of date-range queries
+_NO_DATE = datetime.date.min
+
+
+class LessonIndex:
+    """Rows of the lesson log with a sorted date index and per-athlete/per-type indexes."""
+
+    def __init__(self, headers, generation=None):
+        self.headers = list(headers)
+        # The sheet version the index is up to date with (e.g. the workbook's
+        # ETag), so every worker holding the same version reports the same one
+        self.generation = generation
+        self._date_col = self._column(lesson_log.DATE_HEADER)
+        self._athlete_col = self._column(ATHLETE_HEADER)
+        self._type_col = self._column(LESSON_TYPE_HEADER)
+        self.rows = []
+        self._by_date = []  # sorted (date, position)
+        self._by_athlete = {}  # athlete -> sorted (date, position)
+        self._by_type = {}  # lesson type -> sorted (date, position)
+        self._prefix_digests = {0: b""}  # row count -> chained digest of those rows
+
+    def _column(self, header):
+        return self.headers.index(header) if header in self.headers else None
+
+    def _date_key(self, row):
+        value = row[self._date_col] if self._date_col is not None else None
+        return value if isinstance(value, datetime.date) else _NO_DATE
+
+    @staticmethod
+    def _insert(entries, key):
+        # Rows mostly arrive in date order, so this is usually a plain append
+        if not entries or entries[-1] <= key:
+            entries.append(key)
+        else:
+            bisect.insort(entries, key)
+
+    def extend(self, rows):
+        """Indexes rows appended after the ones already held."""
+        for row in rows:
+            position = len(self.rows)
+            self.rows.append(row)
+            key = (self._date_key(row), position)
+            self._insert(self._by_date, key)
+            if self._athlete_col is not None:
+                self._insert(self._by_athlete.setdefault(row[self._athlete_col], []), key)
+            if self._type_col is not None:
+                self._insert(self._by_type.setdefault(row[self._type_col], []), key)
+
+    def prefix_digest(self, count):
+        """Returns a hex digest of the first count rows, or None if fewer are held.
+
+        Digests are chained row by row, so they only depend on the rows: two
+        indexes agree on a count exactly when their first count rows match.
+        """
+        if count < 0 or count > len(self.rows):
+            return None
+        known = max(held for held in self._prefix_digests if held <= count)
+        digest = self._prefix_digests[known]
+        for row in self.rows[known:count]:
+            digest = hashlib.sha256(digest + repr(row).encode("utf-8")).digest()[:16]
+        self._prefix_digests[count] = digest
+        return digest.hex()
+
+    def _copy(self, generation):
+        """Returns an index over the same rows whose lists can be extended independently."""
+        index = LessonIndex(self.headers, generation)
+        index.rows = list(self.rows)
+        index._by_date = list(self._by_date)
+        index._by_athlete = {athlete: list(entries) for athlete, entries in self._by_athlete.items()}
+        index._by_type = {lesson_type: list(entries) for lesson_type, entries in self._by_type.items()}
+        index._prefix_digests = dict(self._prefix_digests)
+        return index
+
+    def refresh(self, headers, rows, generation=None):
+        """Returns an index brought up to date with a new version of the sheet.
+
+        When the new rows start with exactly the rows already indexed (the
+        usual case: lessons were appended) a copy of this index is extended
+        with the tail. Anything else (edits, deletions, new columns) rebuilds
+        from scratch. Either way the result takes the given generation, e.g.
+        the workbook's ETag, just as an index built cold would. self is never
+        modified, so requests still reading it from the cache are unaffected.
+        """
+        rows = list(rows)
+        held = len(self.rows)
+        if list(headers) == self.headers and len(rows) >= held and rows[:held] == self.rows:
+            if len(rows) == held and generation == self.generation:
+                return self
+            index = self._copy(generation)
+            index.extend(rows[held:])
+        else:
+            index = LessonIndex(headers, generation)
+            index.extend(rows)
+        # Cursors from this version need the digest of every row; chaining
+        # it here keeps the hashing off the request that issues the first one
+        index.prefix_digest(len(index.rows))
+        return index
+
+    def _plan(self, athlete, lesson_type):
+        """Returns (date-sorted entries to walk, [(column, value)] to check on each row)."""
+        # Start from the smallest candidate set, then check the other filter per row
+        candidates = []
+        if athlete is not None:
+            candidates.append((self._by_athlete.get(athlete, []), self._athlete_col, athlete))
+        if lesson_type is not None:
+            candidates.append((self._by_type.get(lesson_type, []), self._type_col, lesson_type))
+        if not candidates:
+            candidates.append((self._by_date, None, None))
+        candidates.sort(key=lambda candidate: len(candidate[0]))
+        return candidates[0][0], [(col, value) for _, col, value in candidates[1:]]
+
+    def _date_bounds(self, entries, date_from, date_to):
+        """Returns the slice of entries whose dates fall within the inclusive bounds."""
+        if date_from is None and date_to is None:
+            return 0, len(entries)
+        low = date_from or datetime.date(datetime.MINYEAR, 1, 2)  # skips _NO_DATE rows
+        start = bisect.bisect_left(entries, (low, -1))
+        end = len(entries) if date_to is None else bisect.bisect_right(entries, (date_to, len(self.rows)))
+        return start, end
+
+    def query(self, athlete=None, lesson_type=None, date_from=None, date_to=None):
+        """Returns matching rows, in date order when any filter is given.
+
+        date_from and date_to are inclusive datetime.date bounds.
+        """
+        if athlete is None and lesson_type is None and date_from is None and date_to is None:
+            return list(self.rows)
+
+        entries, others = self._plan(athlete, lesson_type)
+        start, end = self._date_bounds(entries, date_from, date_to)
+        results = []
+        for _, position in entries[start:end]:
+            row = self.rows[position]
+            if all(row[col] == value for col, value in others):
+                results.append(row)
+        return results
+
+    def page(self, limit, after=None, descending=True, athlete=None, lesson_type=None, date_from=None, date_to=None):
+        """Returns (rows, key of the last row or None) for one page of matches in date order.
+
+        after is the key returned with the previous page; the page starts
+        just past it. The key is None when there are no more matches. Rows
+        with the same date keep their sheet order (reversed when descending).
+        """
+        entries, others = self._plan(athlete, lesson_type)
+        start, end = self._date_bounds(entries, date_from, date_to)
+        if after is not None:
+            if descending:
+                end = min(end, bisect.bisect_left(entries, after))
+            else:
+                start = max(start, bisect.bisect_right(entries, after))
+
+        walk = reversed(range(start, end)) if descending else range(start, end)
+        matches = (
+            entries[i] for i in walk
+            if all(self.rows[entries[i][1]][col] == value for col, value in others)
+        )
+        keys = list(itertools.islice(matches, limit + 1))
+        more = len(keys) > limit
+        keys = keys[:limit]
+        rows = [self.rows[position] for _, position in keys]
+        return rows, (keys[-1] if more else None)
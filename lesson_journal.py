@@ -0,0 +1,207 @@
+"""Write-ahead journal for committed lessons.
+
+/commit-lessons appends lessons here and returns as soon as the SQLite
+transaction is durable. A background flusher then writes them into the
+'lesson log' sheet in batches, so the full workbook rewrite is no longer on
+the request path, and anything left unflushed by a crash is replayed the next
+time the flusher starts.
+
+Commits that arrive within a short window of each other are coalesced into
+one load/append/save of the workbook, and /commit-lessons can wait for its own
+entries to be written. Every flush holds an OS-level lock next to the
+journal, so flushers in different gunicorn workers never write the workbook
+at the same time or write the same entries twice.
+
+Delivery to the workbook is at-least-once: if the process dies after the
+workbook is saved but before the batch is marked flushed, that batch is
+written again on replay.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from file_lock import FileLock
+
+
+class LessonJournal:
+    """Append-only SQLite journal of lessons waiting to be written to the workbook."""
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS journal ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " lesson TEXT NOT NULL,"
+                " created REAL NOT NULL,"
+                " flushed INTEGER NOT NULL DEFAULT 0)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS journal_unflushed ON journal (flushed, id)")
+
+    @contextmanager
+    def _connect(self):
+        """Yields a connection inside a transaction and closes it afterwards."""
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            conn.execute("PRAGMA synchronous=FULL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def append(self, lessons):
+        """Durably records lessons in one transaction and returns their entry ids."""
+        now = time.time()
+        with self._connect() as conn:
+            return [
+                conn.execute(
+                    "INSERT INTO journal (lesson, created) VALUES (?, ?)", (json.dumps(lesson), now)
+                ).lastrowid
+                for lesson in lessons
+            ]
+
+    def unflushed(self, limit=None):
+        """Returns [(entry_id, lesson)] not yet written to the workbook, oldest first."""
+        query = "SELECT id, lesson FROM journal WHERE flushed = 0 ORDER BY id"
+        params = ()
+        if limit is not None:
+            query += " LIMIT ?"
+            params = (limit,)
+        with self._connect() as conn:
+            return [(entry_id, json.loads(lesson)) for entry_id, lesson in conn.execute(query, params)]
+
+    def pending_count(self):
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM journal WHERE flushed = 0").fetchone()[0]
+
+    def oldest_pending_age(self):
+        """Returns how many seconds the oldest unflushed entry has waited, or None."""
+        with self._connect() as conn:
+            created = conn.execute("SELECT MIN(created) FROM journal WHERE flushed = 0").fetchone()[0]
+        return None if created is None else time.time() - created
+
+    def all_flushed(self, entry_ids):
+        """Returns True once every one of these entries has been written to the workbook."""
+        with self._connect() as conn:
+            return all(
+                conn.execute("SELECT flushed FROM journal WHERE id = ?", (i,)).fetchone() != (0,)
+                for i in entry_ids
+            )
+
+    def mark_flushed(self, entry_ids):
+        with self._connect() as conn:
+            conn.executemany("UPDATE journal SET flushed = 1 WHERE id = ?", [(i,) for i in entry_ids])
+
+
+class JournalFlusher:
+    """Background thread that merges the journal into the workbook.
+
+    A flush runs window seconds after notify(), so every commit made
+    meanwhile (by any worker) shares one workbook save, and otherwise once
+    batch_size lessons are waiting or the oldest one has waited interval
+    seconds. write_batch(lessons) must return True only once the lessons are
+    saved; on False the entries stay in the journal and are retried later.
+    """
+
+    def __init__(self, journal, write_batch, batch_size=50, interval=30.0, window=0.2):
+        self.journal = journal
+        self.write_batch = write_batch
+        self.batch_size = batch_size
+        self.interval = interval
+        self.window = window
+        # Anything else that must not overlap a workbook save can take this lock too
+        self.lock_path = f"{journal.path}.lock"
+        self._file_lock = FileLock(self.lock_path)
+        self._wakeup = threading.Event()
+        self._flushed = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._last_flush_failed = False
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        """Starts the flusher once per process, replaying anything left unflushed."""
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="lesson-journal-flusher", daemon=True)
+            self._thread.start()
+
+    def notify(self):
+        """Tells the flusher new entries arrived; it flushes once the coalescing window ends."""
+        self._wakeup.set()
+
+    def wait_flushed(self, entry_ids, timeout):
+        """Waits up to timeout seconds for these entries to be flushed, by this process or any other.
+
+        Returns True once they are in the workbook, False if they are still
+        only journaled (the write failed or is taking longer).
+        """
+        deadline = time.monotonic() + timeout
+        with self._flushed:
+            while True:
+                if self.journal.all_flushed(entry_ids):
+                    return True
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                # Another worker's flusher may write our entries, so poll the journal too
+                self._flushed.wait(min(remaining, 0.25))
+
+    def flush(self):
+        """Writes every unflushed entry to the workbook now, in one save. Returns the number written."""
+        written = 0
+        try:
+            with self._flush_lock, self._file_lock:
+                # Loops only for entries journaled while the previous save ran
+                while True:
+                    entries = self.journal.unflushed()
+                    if not entries:
+                        return written
+                    if not self.write_batch([lesson for _, lesson in entries]):
+                        self._last_flush_failed = True
+                        return written
+                    self.journal.mark_flushed([entry_id for entry_id, _ in entries])
+                    self._last_flush_failed = False
+                    written += len(entries)
+        finally:
+            with self._flushed:
+                self._flushed.notify_all()
+
+    def _due(self):
+        if self.journal.pending_count() >= self.batch_size:
+            return True
+        age = self.journal.oldest_pending_age()
+        return age is not None and age >= self.interval
+
+    def _run(self):
+        # Replay whatever a previous process left behind before waiting
+        self._flush_safely()
+        while True:
+            # After a failed write (e.g. the file is open in Excel) back off a full interval
+            age = self.journal.oldest_pending_age()
+            if age is None or self._last_flush_failed:
+                timeout = self.interval
+            else:
+                timeout = max(0.0, self.interval - age)
+            notified = self._wakeup.wait(timeout)
+            self._wakeup.clear()
+            if notified:
+                # Let commits arriving right behind this one share its save
+                time.sleep(self.window)
+                self._flush_safely()
+            elif self._due():
+                self._flush_safely()
+
+    def _flush_safely(self):
+        try:
+            written = self.flush()
+            if written:
+                print(f"Flushed {written} journaled lessons to Excel")
+        except Exception as e:
+            print(f"Error flushing lesson journal: {e}")
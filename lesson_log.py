@@ -0,0 +1,102 @@
+"""Streaming reader for the 'lesson log' sheet of the lesson tracker workbook."""
+import datetime
+
+LESSON_LOG_SHEET = "lesson log"
+DATE_HEADER = "Date"
+
+# Header of the column each lesson field is written to
+LESSON_COLUMNS = {
+    "date": "Date",
+    "athlete": "Athlete's Name",
+    "duration": "Durations",
+    "lesson_type": "Lesson Types",
+    "focus_area": "Focus Areas",
+}
+
+# Day zero of Excel's 1900 date system, as used by serial date numbers
+EXCEL_EPOCH = datetime.date(1899, 12, 30)
+
+
+def _to_date(value):
+    """Normalises a Date cell to a datetime.date, leaving unparseable values alone."""
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        # Graph's workbook API returns real dates as serial numbers
+        return EXCEL_EPOCH + datetime.timedelta(days=int(value))
+    if isinstance(value, str):
+        try:
+            return datetime.date.fromisoformat(value.strip())
+        except ValueError:
+            return value
+    return value
+
+
+def _typed_row(row, width, date_index):
+    """Trims a raw row to the header width and converts its Date cell."""
+    row = [None if cell == "" else cell for cell in row[:width]]
+    row.extend([None] * (width - len(row)))
+    if date_index is not None:
+        row[date_index] = _to_date(row[date_index])
+    return row
+
+
+def headers_from_row(row):
+    """Returns the leading non-empty cells of a header row."""
+    headers = []
+    for value in row or ():
+        if value is None or value == "":
+            break
+        headers.append(value)
+    return headers
+
+
+def read_headers(sheet):
+    """Returns the leading non-empty header cells of row 1."""
+    return headers_from_row(next(sheet.iter_rows(min_row=1, max_row=1, values_only=True), ()))
+
+
+def lesson_row(headers, lesson):
+    """Lays a lesson dict out as a row matching headers; other columns are None.
+
+    Raises ValueError if one of LESSON_COLUMNS is missing from headers.
+    """
+    row = [None] * len(headers)
+    for field, header in LESSON_COLUMNS.items():
+        row[headers.index(header)] = lesson[field]
+    return row
+
+
+def typed_rows(headers, raw_rows):
+    """Yields non-empty raw rows as typed rows matching the given headers."""
+    width = len(headers)
+    date_index = headers.index(DATE_HEADER) if DATE_HEADER in headers else None
+    for row in raw_rows:
+        if any(cell not in (None, "") for cell in row[:width]):  # skip empty rows
+            yield _typed_row(row, width, date_index)
+
+
+def iter_lesson_rows(source):
+    """Opens 'lesson log' read-only and returns (headers, row iterator).
+
+    Only the lesson log worksheet is parsed, one row at a time, and the VBA
+    part is never loaded. The workbook is opened before returning so a bad
+    file or missing sheet raises here rather than halfway through a response.
+    """
+    import openpyxl  # deferred: only needed once a workbook is actually read
+
+    workbook = openpyxl.load_workbook(source, read_only=True, data_only=True, keep_vba=False)
+    try:
+        sheet = workbook[LESSON_LOG_SHEET]
+        headers = read_headers(sheet)
+    except Exception:
+        workbook.close()
+        raise
+
+    def rows():
+        try:
+            yield from typed_rows(headers, sheet.iter_rows(min_row=2, values_only=True))
+        finally:
+            workbook.close()
+
+    return headers, rows()
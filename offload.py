@@ -0,0 +1,53 @@
+"""Keeps CPU-bound work off the event loop when app.py runs on gevent workers.
+
+Under gunicorn's gevent worker (see Procfile) each request is a greenlet, so
+Graph downloads and token refreshes wait on their sockets cooperatively and
+one worker can have many of them in flight. Parsing a workbook with openpyxl
+is pure CPU, though, and would stall every other greenlet in the worker, so
+it runs on gevent's pool of real OS threads instead. On sync workers and the
+Flask dev server there is no event loop, and these helpers call straight
+through.
+"""
+import itertools
+
+# Rows parsed per trip to the thread pool while streaming
+CHUNK_ROWS = 500
+
+
+def _threadpool():
+    """Returns gevent's native thread pool, or None if gevent isn't running this process."""
+    try:
+        from gevent import monkey
+    except ImportError:
+        return None
+    if not monkey.is_module_patched("socket"):
+        return None
+    import gevent
+    return gevent.get_hub().threadpool
+
+
+def call(fn, *args, **kwargs):
+    """Returns fn(*args, **kwargs), run on a native thread when under gevent."""
+    pool = _threadpool()
+    if pool is None:
+        return fn(*args, **kwargs)
+    return pool.apply(fn, args, kwargs)
+
+
+def iterate(iterable, chunk_size=CHUNK_ROWS):
+    """Yields from iterable, producing items chunk_size at a time on a native thread under gevent."""
+    pool = _threadpool()
+    iterator = iter(iterable)
+    try:
+        if pool is None:
+            yield from iterator
+            return
+        while True:
+            chunk = pool.apply(lambda: list(itertools.islice(iterator, chunk_size)))
+            if not chunk:
+                return
+            yield from chunk
+    finally:
+        close = getattr(iterator, "close", None)
+        if close is not None:
+            close()
@@ -0,0 +1,116 @@
+"""Per-user on-disk cache of the LessonTracker.xlsx download and its parsed rows.
+
+Each user gets a directory under CACHE_DIR holding the raw workbook bytes, the
+rows parsed from 'lesson log' and the ETag/cTag Graph returned with them. The
+tag is sent back as If-None-Match so an unchanged workbook costs a 304.
+
+Rows are stored as a sequence of pickle records rather than one list, so they
+can be written while a response is streaming and read back one at a time.
+"""
+import hashlib
+import json
+import os
+import pickle
+import threading
+
+from config import CACHE_DIR
+
+META_FILE = "meta.json"
+CONTENT_FILE = "LessonTracker.xlsx"
+ROWS_FILE = "rows.pickle"
+
+
+def _user_dir(user_id):
+    """Returns the cache directory for a user, hashed so ids never hit the filesystem raw."""
+    digest = hashlib.sha256(str(user_id).encode("utf-8")).hexdigest()
+    return os.path.join(CACHE_DIR, "onedrive", digest)
+
+
+def _tmp_path(path):
+    # A background prefetch and a request may write the same user's files at once
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+def _write_atomic(path, data):
+    """Writes bytes to path via a temp file so readers never see a partial file."""
+    tmp_path = _tmp_path(path)
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _read_meta(user_id):
+    try:
+        with open(os.path.join(_user_dir(user_id), META_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def get_etag(user_id):
+    """Returns the ETag/cTag of the cached workbook, or None if nothing is cached."""
+    meta = _read_meta(user_id)
+    return meta.get("etag") if meta else None
+
+
+def open_rows(user_id):
+    """Returns (headers, row iterator) over the cached rows, or None if they are missing."""
+    meta = _read_meta(user_id)
+    try:
+        f = open(os.path.join(_user_dir(user_id), ROWS_FILE), "rb")
+    except OSError:
+        return None
+    if meta is None:
+        f.close()
+        return None
+
+    def rows():
+        with f:
+            while True:
+                try:
+                    yield pickle.load(f)
+                except EOFError:
+                    return
+
+    return meta.get("headers", []), rows()
+
+
+def store_content(user_id, chunks):
+    """Writes a downloaded workbook to the cache chunk by chunk and returns its path."""
+    user_dir = _user_dir(user_id)
+    os.makedirs(user_dir, exist_ok=True)
+    path = os.path.join(user_dir, CONTENT_FILE)
+    tmp_path = _tmp_path(path)
+    with open(tmp_path, "wb") as f:
+        for chunk in chunks:
+            f.write(chunk)
+    os.replace(tmp_path, path)
+    return path
+
+
+def cache_rows(user_id, etag, headers, rows):
+    """Yields rows unchanged while appending them to the cache.
+
+    The tag is only recorded once every row has been written, so a response
+    that is cut short never leaves a truncated row set behind a valid tag.
+    """
+    user_dir = _user_dir(user_id)
+    os.makedirs(user_dir, exist_ok=True)
+    path = os.path.join(user_dir, ROWS_FILE)
+    tmp_path = _tmp_path(path)
+    completed = False
+    try:
+        with open(tmp_path, "wb") as f:
+            pickler = pickle.Pickler(f, pickle.HIGHEST_PROTOCOL)
+            for row in rows:
+                pickler.dump(row)
+                pickler.clear_memo()
+                yield row
+        os.replace(tmp_path, path)
+        # Metadata goes last: a tag is only ever advertised once its rows are on disk
+        meta = {"etag": etag, "headers": headers}
+        _write_atomic(os.path.join(user_dir, META_FILE), json.dumps(meta).encode("utf-8"))
+        completed = True
+    finally:
+        if not completed and os.path.exists(tmp_path):
+            os.remove(tmp_path)
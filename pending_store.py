@@ -0,0 +1,121 @@
+"""Server-side store for lessons a coach has queued but not committed yet.
+
+Pending lessons used to live in Flask's signed cookie, which meant every
+change re-sent the whole list. Here they are kept in SQLite under a random
+store id (the only thing left in the cookie), and each store carries a version
+counter that goes up by one on every change, so clients can apply deltas and
+notice when they missed one.
+"""
+import json
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+
+# Stores untouched for this long belong to abandoned sessions
+STORE_MAX_AGE = 30 * 24 * 3600
+
+
+class PendingStore:
+    """SQLite-backed pending lessons, grouped by store id with a version per store."""
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS stores ("
+                " store_id TEXT PRIMARY KEY,"
+                " version INTEGER NOT NULL,"
+                " updated REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS lessons ("
+                " store_id TEXT NOT NULL,"
+                " lesson_id TEXT NOT NULL,"
+                " position INTEGER NOT NULL,"
+                " lesson TEXT NOT NULL,"
+                " PRIMARY KEY (store_id, lesson_id))"
+            )
+            self._prune(conn)
+
+    @contextmanager
+    def _connect(self):
+        """Yields a connection inside a transaction and closes it afterwards."""
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _prune(self, conn):
+        cutoff = time.time() - STORE_MAX_AGE
+        stale = [row[0] for row in conn.execute("SELECT store_id FROM stores WHERE updated < ?", (cutoff,))]
+        conn.executemany("DELETE FROM lessons WHERE store_id = ?", [(s,) for s in stale])
+        conn.executemany("DELETE FROM stores WHERE store_id = ?", [(s,) for s in stale])
+
+    def _bump(self, conn, store_id):
+        """Increments and returns the store's version (must be called inside a write)."""
+        conn.execute(
+            "INSERT INTO stores (store_id, version, updated) VALUES (?, 1, ?)"
+            " ON CONFLICT(store_id) DO UPDATE SET version = version + 1, updated = excluded.updated",
+            (store_id, time.time()),
+        )
+        return conn.execute("SELECT version FROM stores WHERE store_id = ?", (store_id,)).fetchone()[0]
+
+    def version(self, store_id):
+        with self._connect() as conn:
+            row = conn.execute("SELECT version FROM stores WHERE store_id = ?", (store_id,)).fetchone()
+        return row[0] if row else 0
+
+    def list(self, store_id):
+        """Returns (lessons in the order they were added, version)."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT version FROM stores WHERE store_id = ?", (store_id,)).fetchone()
+            lessons = [
+                json.loads(lesson)
+                for (lesson,) in conn.execute(
+                    "SELECT lesson FROM lessons WHERE store_id = ? ORDER BY position", (store_id,)
+                )
+            ]
+        return lessons, (row[0] if row else 0)
+
+    def add(self, store_id, lesson_id, lesson):
+        """Adds a lesson and returns the new version."""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            position = conn.execute(
+                "SELECT COALESCE(MAX(position), 0) + 1 FROM lessons WHERE store_id = ?", (store_id,)
+            ).fetchone()[0]
+            conn.execute(
+                "INSERT INTO lessons (store_id, lesson_id, position, lesson) VALUES (?, ?, ?, ?)",
+                (store_id, lesson_id, position, json.dumps(lesson)),
+            )
+            return self._bump(conn, store_id)
+
+    def update(self, store_id, lesson_id, lesson):
+        """Replaces a lesson in place. Returns the new version, or None if it does not exist."""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            cursor = conn.execute(
+                "UPDATE lessons SET lesson = ? WHERE store_id = ? AND lesson_id = ?",
+                (json.dumps(lesson), store_id, lesson_id),
+            )
+            if cursor.rowcount == 0:
+                return None
+            return self._bump(conn, store_id)
+
+    def remove(self, store_id, lesson_ids):
+        """Removes lessons by id. Returns the new version, or None if none of them existed."""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            removed = 0
+            for lesson_id in lesson_ids:
+                removed += conn.execute(
+                    "DELETE FROM lessons WHERE store_id = ? AND lesson_id = ?", (store_id, lesson_id)
+                ).rowcount
+            if removed == 0:
+                return None
+            return self._bump(conn, store_id)
@@ -0,0 +1,101 @@
+"""Background prefetch of users' lesson logs.
+
+Right after sign-in the OAuth callback hands the user to a small, bounded
+thread pool that downloads and parses their workbook into the on-disk and
+in-memory caches while the browser follows the redirect to /lessons. A
+request that arrives while that fetch is still running joins it instead of
+starting its own. Users seen recently are re-fetched every interval seconds
+so their caches stay warm between visits.
+
+In-flight fetches are tracked per process; a request served by a different
+gunicorn worker still benefits, since the downloaded rows are on shared disk.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Prefetcher:
+    """Runs fetch(user_id, account_id) in the background, at most once at a time per user.
+
+    fetch must not need a request context: it gets the account id and acquires
+    its own token.
+    """
+
+    def __init__(self, fetch, workers=2, interval=300.0, active_window=1800.0):
+        self.fetch = fetch
+        self.interval = interval
+        self.active_window = active_window
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="lesson-prefetch")
+        self._lock = threading.Lock()
+        self._in_flight = {}  # user_id -> Future
+        self._active = {}  # user_id -> (account_id, last seen)
+        self._thread = None
+
+    def start(self):
+        """Starts the periodic refresh thread once per process."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="lesson-prefetch-refresh", daemon=True)
+            self._thread.start()
+
+    def touch(self, user_id, account_id):
+        """Marks the user as active, so their workbook keeps being refreshed."""
+        with self._lock:
+            self._active[user_id] = (account_id, time.monotonic())
+
+    def submit(self, user_id, account_id):
+        """Queues a fetch for the user unless one is already queued or running."""
+        self.touch(user_id, account_id)
+        self.start()
+        with self._lock:
+            future = self._in_flight.get(user_id)
+            if future is not None:
+                return future
+            future = self._executor.submit(self._fetch, user_id, account_id)
+            self._in_flight[user_id] = future
+            return future
+
+    def join(self, user_id):
+        """Waits for the user's in-flight fetch, if any, so the caller finds a warm cache.
+
+        A fetch still waiting for a worker is cancelled instead, since the
+        caller would rather fetch right away than queue behind other users.
+        """
+        with self._lock:
+            future = self._in_flight.get(user_id)
+            if future is not None and future.cancel():
+                del self._in_flight[user_id]
+                return
+        if future is None:
+            return
+        try:
+            future.result()
+        except Exception:
+            pass  # already logged by _fetch; the caller fetches for itself
+
+    def _fetch(self, user_id, account_id):
+        try:
+            self.fetch(user_id, account_id)
+        except Exception as e:
+            print(f"Error prefetching lessons: {e}")
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(user_id, None)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            now = time.monotonic()
+            with self._lock:
+                for user_id, (_, seen) in list(self._active.items()):
+                    if now - seen > self.active_window:
+                        del self._active[user_id]
+                active = list(self._active.items())
+            for user_id, (account_id, _) in active:
+                with self._lock:
+                    if user_id in self._in_flight:
+                        continue
+                    self._in_flight[user_id] = self._executor.submit(self._fetch, user_id, account_id)
@@ -0,0 +1,186 @@
+"""Named timing spans for request phases, Server-Timing headers and /metrics.
+
+Code wraps each phase worth watching in span("name"). Inside a request the
+duration is added to the response's Server-Timing header; everywhere
+(including background threads such as the journal flusher) it feeds a
+rolling window of the last WINDOW samples per phase, from which /metrics
+reports p50/p95/p99 in Prometheus text format. Whole requests are tracked
+the same way per endpoint, and other modules can add their own lines to
+/metrics with add_collector().
+
+Streamed responses send their headers before the body is produced, so phases
+that run while streaming (lazy parsing, template rendering) only show up in
+/metrics. Metrics are per process: each gunicorn worker reports its own.
+"""
+import contextlib
+import math
+import threading
+import time
+from collections import deque
+
+from flask import g, has_request_context, request
+
+WINDOW = 1024  # samples kept per phase
+QUANTILES = (0.5, 0.95, 0.99)
+
+PHASE_METRIC = "lesson_tracker_phase_seconds"
+REQUEST_METRIC = "lesson_tracker_request_seconds"
+
+_lock = threading.Lock()
+_series = {}  # (metric, label value) -> _Window
+_collectors = []  # functions returning extra /metrics lines
+
+
+class _Window:
+    """The last WINDOW samples of one series, plus all-time count and sum."""
+
+    def __init__(self):
+        self.samples = deque(maxlen=WINDOW)
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, seconds):
+        self.samples.append(seconds)
+        self.count += 1
+        self.total += seconds
+
+    def quantiles(self):
+        ordered = sorted(self.samples)
+        if not ordered:
+            return {q: 0.0 for q in QUANTILES}
+        # Nearest-rank quantiles over the window
+        return {q: ordered[max(math.ceil(q * len(ordered)) - 1, 0)] for q in QUANTILES}
+
+
+def _observe(metric, label, seconds):
+    with _lock:
+        window = _series.get((metric, label))
+        if window is None:
+            window = _series[(metric, label)] = _Window()
+        window.add(seconds)
+
+
+def record(name, seconds):
+    """Records one phase duration, and adds it to the current request's Server-Timing."""
+    _observe(PHASE_METRIC, name, seconds)
+    if has_request_context():
+        g.setdefault("timing_spans", []).append((name, seconds))
+
+
+@contextlib.contextmanager
+def span(name):
+    """Times the enclosed block as phase name."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+class TimedIterator:
+    """Iterates over iterable, recording the time spent producing items as one span.
+
+    The span is recorded once the iterator is exhausted or closed. Time spent
+    in exclude (another TimedIterator consumed from inside this one, like the
+    rows a streamed template renders) is subtracted, so nested lazy phases are
+    reported separately instead of twice.
+    """
+
+    def __init__(self, name, iterable, exclude=None):
+        self.name = name
+        self.elapsed = 0.0
+        self._iterator = iter(iterable)
+        self._exclude = exclude
+        self._done = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            return next(self._iterator)
+        except StopIteration:
+            self._finish()
+            raise
+        finally:
+            self.elapsed += time.perf_counter() - start
+
+    def close(self):
+        close = getattr(self._iterator, "close", None)
+        if close is not None:
+            close()
+        self._finish()
+
+    def _finish(self):
+        if not self._done:
+            self._done = True
+            excluded = self._exclude.elapsed if self._exclude is not None else 0.0
+            record(self.name, max(self.elapsed - excluded, 0.0))
+
+
+def _before_request():
+    g.timing_start = time.perf_counter()
+
+
+def _after_request(response):
+    start = g.get("timing_start")
+    if start is None:
+        return response
+    spans = list(g.get("timing_spans", ()))
+    spans.append(("total", time.perf_counter() - start))
+    response.headers["Server-Timing"] = ", ".join(
+        f"{name};dur={seconds * 1000:.1f}" for name, seconds in spans
+    )
+
+    # For streamed bodies the request only ends once the last chunk is sent
+    endpoint = request.endpoint or "unknown"
+    response.call_on_close(lambda: _observe(REQUEST_METRIC, endpoint, time.perf_counter() - start))
+    return response
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render_metrics():
+    """Returns every series as Prometheus summaries in text exposition format."""
+    with _lock:
+        series = {
+            key: (window.quantiles(), window.total, window.count)
+            for key, window in _series.items()
+        }
+
+    lines = []
+    for metric, label, description in (
+        (PHASE_METRIC, "phase", "Duration of named request phases"),
+        (REQUEST_METRIC, "endpoint", "Duration of whole requests, including streamed bodies"),
+    ):
+        lines.append(f"# HELP {metric} {description}; quantiles over the last {WINDOW} samples.")
+        lines.append(f"# TYPE {metric} summary")
+        for (series_metric, value), (quantiles, total, count) in sorted(series.items()):
+            if series_metric != metric:
+                continue
+            value = _escape(value)
+            for q, seconds in quantiles.items():
+                lines.append(f'{metric}{{{label}="{value}",quantile="{q}"}} {seconds:.6f}')
+            lines.append(f'{metric}_sum{{{label}="{value}"}} {total:.6f}')
+            lines.append(f'{metric}_count{{{label}="{value}"}} {count}')
+    for collector in _collectors:
+        lines.extend(collector())
+    return "\n".join(lines) + "\n"
+
+
+def add_collector(collector):
+    """Appends collector()'s lines (already in Prometheus text format) to /metrics."""
+    _collectors.append(collector)
+
+
+def init_app(app):
+    """Adds Server-Timing headers to app's responses and serves /metrics."""
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+
+    @app.route("/metrics")
+    def metrics():
+        return app.response_class(render_metrics(), mimetype="text/plain; version=0.0.4")
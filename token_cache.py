@@ -0,0 +1,164 @@
+"""Shared MSAL discovery and persistent per-user token caches.
+
+Each call builds its own ConfidentialClientApplication around the user's own
+SerializableTokenCache, so concurrent requests for different users never
+wait on each other. The applications share an HTTP session and MSAL's
+http_cache, so authority discovery still happens once per process instead of
+on every request. Each signed-in account's serialized token cache is stored
+in SQLite under CACHE_DIR, which every gunicorn worker can read, and
+acquire_token_silent refreshes expired access tokens from it instead of
+sending the user back through /login.
+"""
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+
+from config import AUTHORITY, CACHE_DIR, CLIENT_ID, CLIENT_SECRET
+
+TOKEN_DB = os.path.join(CACHE_DIR, "msal-token-cache.sqlite3")
+
+# msal is imported on first use, keeping it off the startup path. The lock
+# only guards building the shared pieces; no token call runs under it.
+_lock = threading.Lock()
+_http_client = None
+_http_cache = {}  # MSAL's cache of discovery responses, shared by every app
+_msal_app = None
+_db_ready = False
+
+
+def _new_app(token_cache=None):
+    """Returns a ConfidentialClientApplication sharing the process's HTTP session and discovery."""
+    global _http_client
+    import msal
+
+    with _lock:
+        if _http_client is None:
+            _http_client = requests.Session()
+    return msal.ConfidentialClientApplication(
+        CLIENT_ID,
+        authority=AUTHORITY,
+        client_credential=CLIENT_SECRET,
+        token_cache=token_cache,
+        http_client=_http_client,
+        http_cache=_http_cache,
+    )
+
+
+def get_msal_app():
+    """Returns the process-wide MSAL app, for calls that don't touch a user's tokens."""
+    global _msal_app
+    if _msal_app is None:
+        app = _new_app()
+        with _lock:
+            if _msal_app is None:
+                _msal_app = app
+    return _msal_app
+
+
+def _new_token_cache(blob=None):
+    import msal
+
+    token_cache = msal.SerializableTokenCache()
+    if blob is not None:
+        token_cache.deserialize(blob)
+    return token_cache
+
+
+@contextmanager
+def _connect():
+    global _db_ready
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    conn = sqlite3.connect(TOKEN_DB, timeout=30)
+    try:
+        with conn:
+            if not _db_ready:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS token_caches ("
+                    " account_id TEXT PRIMARY KEY,"
+                    " cache TEXT NOT NULL,"
+                    " updated REAL NOT NULL)"
+                )
+                _db_ready = True
+            yield conn
+    finally:
+        conn.close()
+
+
+def _load(account_id):
+    with _connect() as conn:
+        row = conn.execute(
+            "SELECT cache FROM token_caches WHERE account_id = ?", (account_id,)
+        ).fetchone()
+    return row[0] if row else None
+
+
+def _save(account_id, token_cache):
+    with _connect() as conn:
+        conn.execute(
+            "INSERT INTO token_caches (account_id, cache, updated) VALUES (?, ?, ?)"
+            " ON CONFLICT(account_id) DO UPDATE SET cache = excluded.cache, updated = excluded.updated",
+            (account_id, token_cache.serialize(), time.time()),
+        )
+
+
+def initiate_auth_code_flow(scopes, redirect_uri):
+    """Starts the auth code flow on the shared app."""
+    return get_msal_app().initiate_auth_code_flow(scopes, redirect_uri=redirect_uri)
+
+
+def acquire_token_by_auth_code_flow(flow, auth_response):
+    """Redeems the auth code and persists the new account's token cache.
+
+    Returns (result, account_id); account_id is None when MSAL reports an error.
+    May raise ValueError like ConfidentialClientApplication does.
+    """
+    token_cache = _new_token_cache()
+    app = _new_app(token_cache)
+    result = app.acquire_token_by_auth_code_flow(flow, auth_response)
+    if "error" in result:
+        return result, None
+    accounts = app.get_accounts()
+    if not accounts:
+        return result, None
+    account_id = accounts[0]["home_account_id"]
+    _save(account_id, token_cache)
+    return result, account_id
+
+
+def acquire_token_silent(account_id, scopes):
+    """Returns a valid access token for the account, refreshing it if needed.
+
+    Returns None when there is no cached account or the refresh token no
+    longer works, in which case the user has to sign in again.
+    """
+    if not account_id:
+        return None
+    blob = _load(account_id)
+    if blob is None:
+        return None
+    token_cache = _new_token_cache(blob)
+    app = _new_app(token_cache)
+    account = next(
+        (a for a in app.get_accounts() if a["home_account_id"] == account_id), None
+    )
+    if account is None:
+        return None
+    result = app.acquire_token_silent(scopes, account=account)
+    if token_cache.has_state_changed:
+        _save(account_id, token_cache)
+    if not result or "access_token" not in result:
+        return None
+    return result["access_token"]
+
+
+def remove_account(account_id):
+    """Forgets an account's cached tokens, e.g. on logout."""
+    if not account_id:
+        return
+    with _connect() as conn:
+        conn.execute("DELETE FROM token_caches WHERE account_id = ?", (account_id,))
@@ -0,0 +1,246 @@
+"""Memory-bounded cache of parsed per-user workbooks, shared by a worker's requests.
+
+Every Microsoft login has its own LessonTracker.xlsx, so anything kept per
+user in memory grows with the number of users. WorkbookCache holds one
+version per (user, item), keyed by (user id, item, ETag), within a byte
+budget: entries are measured when stored, the least recently used ones are
+evicted once the budget is exceeded, and entries idle for longer than the
+TTL are evicted on the next access. Evicted entries are pickled to a disk
+tier (itself size-bounded) that every worker on the machine shares, so a
+returning user costs a file read instead of a download and parse.
+
+Hit, miss and eviction counters are reported on /metrics.
+"""
+import hashlib
+import os
+import pickle
+import sys
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+CACHE_METRIC = "lesson_tracker_cache"
+EVENTS = ("hits", "disk_hits", "misses", "evictions", "expirations", "spills", "spill_evictions")
+
+_caches = weakref.WeakSet()  # every live WorkbookCache, for /metrics
+
+# Lists longer than this are sized from an evenly spaced sample of their items
+SIZE_SAMPLE = 256
+
+
+def _deep_size(obj, seen):
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        items = [item for pair in obj.items() for item in pair]
+    elif isinstance(obj, (list, tuple)):
+        items = obj
+    elif isinstance(obj, (set, frozenset)):
+        items = list(obj)
+    elif hasattr(obj, "__dict__"):
+        return size + _deep_size(vars(obj), seen)
+    else:
+        return size
+    if len(items) <= SIZE_SAMPLE:
+        return size + sum(_deep_size(item, seen) for item in items)
+    step = len(items) / SIZE_SAMPLE
+    sample = [items[int(i * step)] for i in range(SIZE_SAMPLE)]
+    return size + int(sum(_deep_size(item, seen) for item in sample) * step)
+
+
+def measure(obj):
+    """Returns an estimate of the bytes obj and everything it references occupy."""
+    return _deep_size(obj, set())
+
+
+class WorkbookCache:
+    """LRU/TTL cache of one value per (user, item), bounded in bytes, with a disk tier."""
+
+    def __init__(self, name, budget_bytes, ttl, spill_dir=None, spill_budget_bytes=0):
+        self.name = name
+        self.budget_bytes = budget_bytes
+        self.ttl = ttl
+        self.spill_dir = spill_dir if spill_budget_bytes > 0 else None
+        self.spill_budget_bytes = spill_budget_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # (user_id, item) -> [etag, value, size, last_used], oldest first
+        self._bytes = 0
+        self._counters = dict.fromkeys(EVENTS, 0)
+        _caches.add(self)
+
+    def _count(self, counter):
+        with self._lock:
+            self._counters[counter] += 1
+
+    def get(self, user_id, item, etag):
+        """Returns the value cached for this version of the user's item, or None."""
+        held = self._lookup(user_id, item)
+        if held is None or held[0] != etag:
+            self._count("misses")
+            return None
+        self._count("disk_hits" if held[2] else "hits")
+        return held[1]
+
+    def held(self, user_id, item):
+        """Returns (etag, value) of whatever version of the user's item is cached, or None.
+
+        Lets a caller bring an older version up to date instead of starting over.
+        """
+        held = self._lookup(user_id, item)
+        return held[:2] if held is not None else None
+
+    def _lookup(self, user_id, item):
+        """Returns (etag, value, whether it came from disk) for the user's item, or None."""
+        key = (user_id, item)
+        now = time.monotonic()
+        with self._lock:
+            expired = self._expire(now)
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry[3] = now
+                self._entries.move_to_end(key)
+        self._spill(expired)
+        if entry is not None:
+            return entry[0], entry[1], False
+
+        loaded = self._load(key)
+        if loaded is None:
+            return None
+        etag, value = loaded
+        self.put(user_id, item, etag, value)
+        return etag, value, True
+
+    def put(self, user_id, item, etag, value):
+        """Caches value as the current version of the user's item, replacing older versions."""
+        key = (user_id, item)
+        size = measure(value)
+        now = time.monotonic()
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            self._entries[key] = [etag, value, size, now]
+            self._bytes += size
+            evicted = self._expire(now)
+            # Always keep the entry just stored, even if it alone is over budget
+            while self._bytes > self.budget_bytes and len(self._entries) > 1:
+                evicted_key, entry = self._entries.popitem(last=False)
+                self._bytes -= entry[2]
+                self._counters["evictions"] += 1
+                evicted.append((evicted_key, entry))
+        self._spill(evicted)
+
+    def _expire(self, now):
+        """Removes entries idle for longer than the TTL (caller holds the lock)."""
+        expired = []
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if now - entry[3] <= self.ttl:
+                break
+            del self._entries[key]
+            self._bytes -= entry[2]
+            self._counters["expirations"] += 1
+            expired.append((key, entry))
+        return expired
+
+    def _spill_path(self, key):
+        digest = hashlib.sha256(repr(key).encode("utf-8")).hexdigest()
+        return os.path.join(self.spill_dir, f"{digest}.pickle")
+
+    def _spill(self, evicted):
+        """Writes evicted entries to the disk tier, then trims it to its budget."""
+        if not evicted or self.spill_dir is None:
+            return
+        os.makedirs(self.spill_dir, exist_ok=True)
+        for key, (etag, value, _, _) in evicted:
+            path = self._spill_path(key)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                with open(tmp_path, "wb") as f:
+                    pickle.dump((key, etag, value), f, pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp_path, path)
+                self._count("spills")
+            except (OSError, pickle.PicklingError) as e:
+                print(f"Warning: could not spill cache entry to disk: {e}")
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+        self._trim_spill()
+
+    def _trim_spill(self):
+        files = []
+        for entry in os.scandir(self.spill_dir):
+            if entry.name.endswith(".pickle"):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue  # removed by another worker
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.spill_budget_bytes:
+                break
+            try:
+                os.remove(path)
+                self._count("spill_evictions")
+            except OSError:
+                pass
+            total -= size
+
+    def _load(self, key):
+        """Returns (etag, value) from the disk tier, or None. A loaded file is removed from it."""
+        if self.spill_dir is None:
+            return None
+        path = self._spill_path(key)
+        try:
+            with open(path, "rb") as f:
+                stored_key, etag, value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        if stored_key != key:
+            return None
+        try:
+            os.remove(path)  # back in memory; spilled again if evicted again
+        except OSError:
+            pass
+        return etag, value
+
+    def clear(self):
+        """Drops every entry, in memory and on disk. Counters are kept."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+        if self.spill_dir is not None and os.path.isdir(self.spill_dir):
+            for entry in os.scandir(self.spill_dir):
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+
+    def stats(self):
+        """Returns the counters plus the current entry count and bytes held in memory."""
+        with self._lock:
+            stats = dict(self._counters)
+            stats["entries"] = len(self._entries)
+            stats["bytes"] = self._bytes
+        return stats
+
+
+def metric_lines():
+    """Returns every cache's counters and gauges in Prometheus text format."""
+    stats = [(cache.name, cache.stats()) for cache in list(_caches)]
+    lines = [
+        f"# HELP {CACHE_METRIC}_events_total Cache lookups and evictions by outcome.",
+        f"# TYPE {CACHE_METRIC}_events_total counter",
+    ]
+    for name, values in stats:
+        for event in EVENTS:
+            lines.append(f'{CACHE_METRIC}_events_total{{cache="{name}",event="{event}"}} {values[event]}')
+    for gauge, description in (("bytes", "Estimated bytes held in memory."), ("entries", "Entries held in memory.")):
+        lines.append(f"# HELP {CACHE_METRIC}_{gauge} {description}")
+        lines.append(f"# TYPE {CACHE_METRIC}_{gauge} gauge")
+        for name, values in stats:
+            lines.append(f'{CACHE_METRIC}_{gauge}{{cache="{name}"}} {values[gauge]}')
+    return lines
@@ -0,0 +1,172 @@
+"""Columnar snapshots of the workbook's data sheets.
+
+The first time a workbook fingerprint is seen, 'lesson log', 'skater info'
+and 'list info' are parsed once and every column is written as its own .npy
+file. Later reads, including those from a freshly started process, load just
+the columns they ask for, memory-mapped where the dtype allows (numbers,
+dates, and text stored as fixed-width unicode with a separate null mask),
+instead of parsing the xlsm's XML again.
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+import numpy as np
+import pandas as pd
+
+from config import CACHE_DIR
+
+SNAPSHOT_SHEETS = ("lesson log", "skater info", "list info")
+SNAPSHOT_DIR = os.path.join(CACHE_DIR, "snapshots")
+MANIFEST = "manifest.json"
+
+_build_lock = threading.Lock()
+
+
+def _digest(value):
+    return hashlib.sha256(repr(value).encode("utf-8")).hexdigest()[:16]
+
+
+def _column_to_arrays(series):
+    """Returns (kind, values, mask) for one column; mask is None when not needed."""
+    if (
+        pd.api.types.is_bool_dtype(series)
+        or pd.api.types.is_numeric_dtype(series)
+        or pd.api.types.is_datetime64_any_dtype(series)
+    ):
+        return "native", series.to_numpy(), None
+    values = series.to_numpy(dtype=object)
+    mask = pd.isna(values)
+    present = values[~mask]
+    if all(isinstance(value, str) for value in present):
+        text = np.where(mask, "", values).astype(str)
+        return "text", text, mask
+    # Mixed cell types (e.g. a label above numbers): keep the Python objects as-is
+    return "object", values, None
+
+
+def _write_sheet(sheet_dir, df):
+    os.makedirs(sheet_dir)
+    columns = []
+    digest = hashlib.sha256()
+    for position, name in enumerate(df.columns):
+        kind, values, mask = _column_to_arrays(df.iloc[:, position])
+        paths = [os.path.join(sheet_dir, f"{position}.npy")]
+        np.save(paths[0], values, allow_pickle=(kind == "object"))
+        if mask is not None:
+            paths.append(os.path.join(sheet_dir, f"{position}.mask.npy"))
+            np.save(paths[1], mask)
+        columns.append({"name": str(name), "kind": kind})
+        digest.update(str(name).encode("utf-8"))
+        for path in paths:
+            with open(path, "rb") as f:
+                digest.update(f.read())
+    return {"rows": len(df), "columns": columns, "digest": digest.hexdigest()}
+
+
+class Snapshot:
+    """Read access to one snapshot directory."""
+
+    def __init__(self, path, manifest):
+        self.path = path
+        self.manifest = manifest
+        self.sheet_names = manifest["sheet_names"]
+
+    def has_sheet(self, sheet):
+        return sheet in self.manifest["sheets"]
+
+    def digest(self, sheet):
+        """Returns a hash of the sheet's contents, equal across workbook versions that didn't change it."""
+        return self.manifest["sheets"][sheet].get("digest")
+
+    def columns(self, sheet):
+        return [column["name"] for column in self.manifest["sheets"][sheet]["columns"]]
+
+    def _sheet_dir(self, sheet):
+        return os.path.join(self.path, _digest(sheet))
+
+    def column(self, sheet, name):
+        """Loads one column as a pandas Series, memory-mapping its data when possible."""
+        columns = self.manifest["sheets"][sheet]["columns"]
+        position, spec = next((i, c) for i, c in enumerate(columns) if c["name"] == name)
+        base = os.path.join(self._sheet_dir(sheet), str(position))
+        if spec["kind"] == "object":
+            return pd.Series(np.load(f"{base}.npy", allow_pickle=True), name=name, dtype=object)
+        values = np.load(f"{base}.npy", mmap_mode="r")
+        if spec["kind"] == "native":
+            return pd.Series(values, name=name, copy=False)
+        mask = np.load(f"{base}.mask.npy", mmap_mode="r")
+        text = values.astype(object)
+        text[mask] = np.nan
+        return pd.Series(text, name=name, dtype=object)
+
+    def frame(self, sheet, columns=None):
+        """Returns the sheet as a DataFrame holding only the requested columns."""
+        names = self.columns(sheet)
+        if columns is not None:
+            names = [name for name in names if name in columns]
+        return pd.DataFrame({name: self.column(sheet, name) for name in names}, columns=names)
+
+
+def _snapshot_path(path, fingerprint):
+    return os.path.join(SNAPSHOT_DIR, f"{_digest(path)}-{_digest(tuple(fingerprint))}")
+
+
+def _load(snapshot_path):
+    try:
+        with open(os.path.join(snapshot_path, MANIFEST), encoding="utf-8") as f:
+            return Snapshot(snapshot_path, json.load(f))
+    except (OSError, ValueError):
+        return None
+
+
+def _build(path, snapshot_path):
+    tmp_path = f"{snapshot_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    try:
+        with pd.ExcelFile(path, engine="openpyxl") as excel_file:
+            sheet_names = list(excel_file.sheet_names)
+            sheets = {}
+            for sheet in SNAPSHOT_SHEETS:
+                if sheet in sheet_names:
+                    sheets[sheet] = _write_sheet(os.path.join(tmp_path, _digest(sheet)), excel_file.parse(sheet))
+        manifest = {"source": path, "sheet_names": sheet_names, "sheets": sheets}
+        with open(os.path.join(tmp_path, MANIFEST), "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        try:
+            os.rename(tmp_path, snapshot_path)
+        except OSError:
+            # Another process published the same snapshot first
+            shutil.rmtree(tmp_path, ignore_errors=True)
+    except Exception:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+
+
+def _remove_stale(path, keep):
+    """Deletes older snapshots of the same workbook."""
+    prefix = f"{_digest(path)}-"
+    for name in os.listdir(SNAPSHOT_DIR):
+        full = os.path.join(SNAPSHOT_DIR, name)
+        if name.startswith(prefix) and full != keep and not name.endswith(".tmp"):
+            shutil.rmtree(full, ignore_errors=True)
+
+
+def get_snapshot(path, fingerprint):
+    """Returns the Snapshot for this workbook version, building it on first use."""
+    snapshot_path = _snapshot_path(path, fingerprint)
+    snapshot = _load(snapshot_path)
+    if snapshot is not None:
+        return snapshot
+    with _build_lock:
+        snapshot = _load(snapshot_path)
+        if snapshot is None:
+            os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+            print(f"Building columnar snapshot of {path}")
+            _build(path, snapshot_path)
+            _remove_stale(path, snapshot_path)
+            snapshot = _load(snapshot_path)
+    return snapshot